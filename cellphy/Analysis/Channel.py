@@ -1,158 +1,291 @@
 from cellphy.Analysis import Track
-import pandas as pd
+from cellphy.Analysis.Track import batch_fit
+from cellphy.Analysis.cache import ResultCache
+from cellphy.Analysis.ied import pdist, frame_distance_stats, frame_sampled_stats, frame_nearest_neighbours, \
+    CHUNK_SIZE
+from cellphy.Analysis.reader import read_tracks
+from cellphy.Analysis.sidecar import load_store, save_store
+from cellphy.Analysis.colocalize import track_bounds
+from cellphy.Analysis.TrackStore import TrackStore, FrameIndex, TrackView, LazyTracks
 from pathlib import PurePath
 from functools import reduce
 import numpy as np
-import itertools
-import statistics
-from cellphy.Analysis.functions import distance
+from cellphy.Analysis.msd import msd_matrix, time_lag_msd_matrix, msd_at_lags, log_lags
+from cellphy.Analysis.fitting import fit_power_law, lag_times
 
 
 class Channel:
 
     def __init__(self, file_path=None, channel_name='Untitled', header=1,
-                 data=None, color=[255, 255, 255], suffix='_C0'):
+                 data=None, color=[255, 255, 255], suffix='_C0', chunk_size=None, use_cache=True):
 
         self.name = channel_name
         self.data_file = file_path
-        self.raw_data = data
-        self.tracks = []
+        self._raw_data = data
+        self.tracks = TrackView([], np.zeros(0, dtype=np.int64))
         self.tracks_backup = []
-        self.tracks_hash_map = {}
+        # per track of tracks_backup: id, length, last time point, row of every id and the filter mask
+        self.backup_ids = np.zeros(0)
+        self.track_lengths = np.zeros(0, dtype=np.int64)
+        self.track_ends = np.zeros(0)
+        self.track_rows = {}
+        self.mask = None
         self.suffix = suffix
         self.header = header
+        # rows per chunk when reading files too large to parse in one go
+        self.chunk_size = chunk_size
+        # keep the parsed arrays in a sidecar cache next to the csv
+        self.use_cache = use_cache
         self.filter_size = 4
         self.bin_value = 0
         self.base_color = color
         self.max_time_point = 0
         self.time_point_position_map = {}
         self.track_ids = None
+        self.store = None
+        # results over the current self.tracks, cleared whenever that set changes
+        self.cache = ResultCache()
         if self.data_file is not None:
             self.load_data(self.data_file)
 
-    def load_data(self, data_file):
-        names = [f'X{self.suffix}', f'Y{self.suffix}', f'Z{self.suffix}', 'unit', 'category', 'collection', 'time',
-                 f'trackid{self.suffix}', 'id']
-        self.name = PurePath(data_file).name
-        self.raw_data = pd.read_csv(data_file, names=names, header=self.header)
-        self.raw_data.pop('unit')
-        self.raw_data.pop('category')
-        self.raw_data.pop('collection')
-        self.raw_data.pop('id')
+    @property
+    def raw_data(self):
+        # spots of the channel, rebuilt from the store when it came from the sidecar cache
+        if self._raw_data is None and self.store is not None:
+            self._raw_data = self.store.to_frame(None, self.suffix)
+        return self._raw_data
 
-        self.track_ids = self.raw_data[f'trackid{self.suffix}'].unique()
+    @raw_data.setter
+    def raw_data(self, data):
+        self._raw_data = data
 
-        for _id in self.track_ids:
-            if len(list(self.raw_data[self.raw_data[f'trackid{self.suffix}'] == _id]['time'])) >= 4:
-                t = Track(track_id=_id, name=self.name, color=self.base_color, suffix=self.suffix,
-                          raw_data=self.raw_data[self.raw_data[f'trackid{self.suffix}'] == _id], parent=self)
+    def load_data(self, data_file, store=None):
+        # store: TrackStore of data_file when it was already parsed elsewhere (see loader.load_channels)
+        self.name = PurePath(data_file).name
+        self.store = store
+        if self.store is None and self.use_cache:
+            self.store = load_store(data_file, self.suffix, self.header)
+        if self.store is None:
+            self.raw_data = read_tracks(data_file, suffix=self.suffix, header=self.header,
+                                        chunk_size=self.chunk_size)
+            self.store = TrackStore.from_frame(self.raw_data, self.suffix)
+            if self.use_cache:
+                save_store(self.store, data_file, self.suffix, self.header)
+        self.track_ids = self.store.track_ids
 
-                self.tracks_backup.append(t)
+        # group sizes come straight from the offsets, Track objects are only
+        # built when a track is accessed
+        lengths = self.store.lengths()
+        rows = np.flatnonzero(lengths >= 4)
+        self.tracks_backup = LazyTracks(self._make_track, rows)
+        self._index_tracks(self.track_ids[rows], lengths[rows], self.store.time[self.store.offsets[rows + 1] - 1])
         self.apply_filter(self.filter_size)
         self.max_time_point = self._get_max_time_point()
 
+    def _make_track(self, index):
+        return Track(track_id=self.track_ids[index], name=self.name, color=self.base_color, suffix=self.suffix,
+                     parent=self, store=self.store, index=index)
+
+    def _index_tracks(self, ids=None, lengths=None, ends=None):
+        if ids is None:
+            ids = [t.track_id for t in self.tracks_backup]
+            lengths = [len(t) for t in self.tracks_backup]
+            ends = [t.max_time_point for t in self.tracks_backup]
+        self.backup_ids = np.asarray(ids)
+        self.track_lengths = np.asarray(lengths, dtype=np.int64)
+        self.track_ends = np.asarray(ends)
+        self.track_rows = {track_id: row for row, track_id in enumerate(self.backup_ids.tolist())}
+        self.mask = None
+
     def apply_filter(self, filter_value=4):
         self.filter_size = filter_value
-        self.tracks = []
-        self.tracks_hash_map = {}
-        for t in self.tracks_backup:
-            if len(t.time_position_map) >= filter_value:
-                self.tracks.append(t)
-                self.tracks_hash_map[t.track_id] = t
+        mask = self.track_lengths >= filter_value
+        if self.mask is not None and np.array_equal(mask, self.mask):
+            # same tracks as before, keep the cached results
+            return
+        self.mask = mask
+        self.cache.clear()
+        self.tracks = TrackView(self.tracks_backup, np.flatnonzero(mask))
 
     def _get_max_time_point(self):
-        times = []
-        for t in self.tracks:
-            times.append(t.max_time_point)
-        return max(times)
+        return max(self.track_ends[self.tracks.index])
 
     # def add_track(self, _track):
     #     self.tracks_backup.append(_track)
 
     def set_track(self, _tracks):
-        self.tracks_backup = _tracks
+        self.tracks_backup = list(_tracks)
+        self._index_tracks()
         self.apply_filter(self.filter_size)
 
+    def _store_rows(self):
+        # store rows of self.tracks, None when some of them are not views on self.store (set_track / add_track)
+        if not isinstance(self.tracks_backup, LazyTracks):
+            return None
+        index = np.asarray(self.tracks.index, dtype=np.int64)
+        if len(index) and index.max() >= len(self.tracks_backup.rows):
+            return None
+        return self.tracks_backup.rows[index]
+
+    def frame_index(self):
+        # built once per track set, apply_filter / set_track drop it; owners are rows of self.tracks
+        result = self.cache.get(('frame_index',))
+        if result is None:
+            rows = self._store_rows()
+            if rows is not None:
+                # straight from the store arrays, no Track is built
+                result = FrameIndex(*self.store.gather(rows))
+            else:
+                # single spot tracks are left out
+                rows = [row for row, tr in enumerate(self.tracks) if len(tr) > 1]
+                result = FrameIndex.from_tracks([self.tracks[row] for row in rows], rows)
+            self.cache.put(('frame_index',), result)
+        return result
+
+    def track_bounds(self):
+        # per track of self.tracks: first / last time point and bounding box, see colocalize.track_bounds
+        result = self.cache.get(('track_bounds',))
+        if result is None:
+            rows = self._store_rows()
+            result = self.cache.put(('track_bounds',), self.store.bounds(rows) if rows is not None
+                                    else track_bounds(self.tracks))
+        return result
+
     def get_time_point_position_map(self):
-        # filter tracks
-        _tracks = [tr for tr in self.tracks if len(tr.time_position_map) > 1]
+        # time point -> (n, 3) view of the positions in that frame
         time_point_position_map = {}
-        for i in range(self._get_max_time_point()+1):
-            for t in _tracks:
-                pos = t.get_position_by_time_point(i)
-                if pos:
-                    if not time_point_position_map.get(i, 0):
-                        time_point_position_map[i] = []
-                    time_point_position_map[i].append(pos)
+        for time, pos in self.frame_index().items():
+            time_point_position_map[int(time)] = pos
         return time_point_position_map
 
     def get_distance_between_pos_by_time(self):
-        time_pos_map = self.get_time_point_position_map()
         time_pos_distance_map = {}
-        for time, pos in time_pos_map.items():
-            for p1, p2 in itertools.combinations(pos, 2):
-                if not time_pos_distance_map.get(time, 0):
-                    time_pos_distance_map[time] = []
-                time_pos_distance_map[time].append(distance(np.array(p1), np.array(p2)))
+        for time, pos in self.frame_index().items():
+            if len(pos) > 1:
+                time_pos_distance_map[int(time)] = pdist(pos)
         return time_pos_distance_map
 
-    def get_time_point_mean_and_stdev(self):
-        time_point_distance = self.get_distance_between_pos_by_time()
+    def get_time_point_distance_stats(self, bins=None, chunk_size=CHUNK_SIZE):
+        # per frame count / mean / stdev / min / max (and histogram) of the pairwise distances
+        return frame_distance_stats(self.frame_index().items(), chunk_size=chunk_size, bins=bins)
+
+    def get_time_point_sampled_stats(self, n_pairs=10000, seed=0, confidence=0.95):
+        # per frame mean / stdev estimated from n_pairs random pairs, with confidence bounds
+        return frame_sampled_stats(self.frame_index().items(), n_pairs=n_pairs, seed=seed, confidence=confidence)
+
+    def get_time_point_mean_and_stdev(self, n_pairs=None, seed=0):
+        # exact unless n_pairs is given, then estimated from that many random pairs per frame
+        if n_pairs:
+            stats = self.get_time_point_sampled_stats(n_pairs, seed)
+            stats['count'] = stats['pairs']
+        else:
+            stats = self.get_time_point_distance_stats()
         time_pos_distance_mean_map = {}
-        for time, pos in time_point_distance.items():
-            if len(pos) > 1:
-                time_pos_distance_mean_map[time] = [time, statistics.mean(pos), statistics.stdev(pos)]
-            time_pos_distance_mean_map[time] = [time, pos[0], pos[0]]
+        for time, count, mean, stdev in zip(stats['time'], stats['count'], stats['mean'], stats['stdev']):
+            if count > 1:
+                time_pos_distance_mean_map[int(time)] = [int(time), mean, stdev]
+            else:
+                time_pos_distance_mean_map[int(time)] = [int(time), mean, mean]
 
         return time_pos_distance_mean_map
 
+    def nearest_neighbour_distances(self, k=1):
+        # (n_spots, k) distances to the k nearest spots of the same frame, rows follow frame_index()
+        key = ('nearest_neighbours', k)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.cache.put(key, frame_nearest_neighbours(self.frame_index(), k))
+        return result
+
+    def get_time_point_nn_distances(self, k=1):
+        # time point -> (n_spots, k) nearest neighbour distances of that frame
+        index = self.frame_index()
+        distances = self.nearest_neighbour_distances(k)
+        return {t: distances[index.offsets[i]:index.offsets[i + 1]] for i, t in enumerate(index.frames)}
+
+    def get_track_nn_distances(self, k=1):
+        # track id -> (time, (n_spots, k) nearest neighbour distances) ordered by time
+        index = self.frame_index()
+        distances = self.nearest_neighbour_distances(k)
+        order = np.argsort(index.owner, kind='mergesort')
+        bounds = np.searchsorted(index.owner[order], np.arange(len(self.tracks) + 1))
+        result = {}
+        for i, t in enumerate(self.tracks):
+            rows = order[bounds[i]:bounds[i + 1]]
+            result[t.track_id] = (index.time[rows], distances[rows])
+        return result
+
+    def msd_matrix(self, limit=26, by_time=False):
+        # rows follow self.tracks, column j is lag j+1, NaN where a track is too short
+        if by_time:
+            return time_lag_msd_matrix([t.positions for t in self.tracks], [t.time for t in self.tracks],
+                                       limit=limit)
+        return msd_matrix([t.positions for t in self.tracks], limit=limit)
+
+    def log_msd_matrix(self, n_lags=20):
+        # whole track msd at log spaced lags shared by all tracks: lags, (n_tracks, len(lags)) msd and counts
+        lengths = np.array([len(t) for t in self.tracks], dtype=np.int64)
+        lags = log_lags(lengths.max() - 1 if len(lengths) else 0, n_lags)
+        if not len(lengths):
+            return lags, np.zeros((0, len(lags))), np.zeros((0, len(lags)), dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        _msd, counts = msd_at_lags(np.concatenate([t.positions for t in self.tracks]), lags, offsets)
+        return lags, _msd, counts
+
+    def fit_msd(self, limit=26, refine='auto'):
+        # d and alfa of every track in self.tracks from one batched fit, see fit_power_law for refine
+        if not (isinstance(refine, str) and refine == 'auto'):
+            _msd, _ = self.msd_matrix(limit=limit)
+            return fit_power_law(_msd, lag_times(_msd.shape[1]), refine=refine)
+
+        key = ('fit', limit)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.cache.put(key, batch_fit(self.tracks, limit=limit))
+        return result
+
+    def get_alfa_map(self, limit=26):
+        _, alfa = self.fit_msd(limit=limit)
+        return dict(zip([t.track_id for t in self.tracks], alfa))
+
+    def cache_info(self):
+        # channel level counters plus the sum over the per track caches
+        info = {'channel': self.cache.info(), 'hits': 0, 'misses': 0, 'size': 0}
+        built = self.tracks_backup.built() if isinstance(self.tracks_backup, LazyTracks) else self.tracks_backup
+        for t in built:
+            for k, v in t.cache_info().items():
+                info[k] += v
+        return info
+
     def bin_tracks(self, bin_value=0, radius=0):
-        # tracks_bin = {}
         total_dict = {}
         _channels = []
         self.bin_value = bin_value
-        # it_track = copy.deepcopy(self.tracks)
-        m_track = self.tracks.copy()
+        _, alfa = self.fit_msd()
+        gt = alfa > 1.4
         if bin_value:
-            for sb in range(0, self._get_max_time_point(), bin_value):
-                it_track = m_track.copy()
-                # print(f'len(it_track){len(it_track)}')
-                tb = []
-                for t in it_track:
-                    tk = np.array(list(t.time_position_map.keys()))
-                    if np.any((sb >= tk) * (sb <= (sb + bin_value))):
-                        # if not tracks_bin.get(sb, False):
-                        #     tracks_bin[sb] = []
-                        # tracks_bin[sb].append(t)
-                        tb.append(t)
-                        m_track.remove(t)
-                if len(tb) > 0:
-                    _channel = Channel(channel_name=f'{sb-bin_value}-{sb}_{radius:.1f}',
-                                       suffix=self.suffix, color=self.base_color.copy())
-                    _channel.set_track(tb)
-                    _channels.append(_channel)
-                    if not total_dict.get(f'{sb-bin_value}-{sb}', False):
-                        total_dict[f'{sb-bin_value}-{sb}'] = {'total': 0, 'lt': 0, 'gt': 0}
-
-                    current = total_dict[f'{sb-bin_value}-{sb}']
-                    current['total'] = len(tb)
-                    for t in tb:
-                        alfa, _ = t.basic_fit()
-                        if alfa > 1.4:
-                            current['gt'] += 1
-                        else:
-                            current['lt'] += 1
+            # a track goes to the first bin start sb with sb >= its first time point,
+            # tracks starting after the last bin start are left out
+            t_min = self.track_bounds()[0]
+            starts = np.arange(0, self._get_max_time_point(), bin_value)
+            assigned = np.searchsorted(starts, t_min, side='left')
+            order = np.argsort(assigned, kind='mergesort')
+            bounds = np.searchsorted(assigned[order], np.arange(len(starts) + 1))
+            for b, sb in enumerate(starts):
+                rows = order[bounds[b]:bounds[b + 1]]
+                if not len(rows):
+                    continue
+                tb = [self.tracks[i] for i in rows]
+                _channel = Channel(channel_name=f'{sb-bin_value}-{sb}_{radius:.1f}',
+                                   suffix=self.suffix, color=self.base_color.copy())
+                _channel.set_track(tb)
+                _channels.append(_channel)
+                n_gt = int(gt[rows].sum())
+                total_dict[f'{sb-bin_value}-{sb}'] = {'total': len(tb), 'lt': len(tb) - n_gt, 'gt': n_gt}
         else:
             _channels.append(self)
-            total_dict[f'all'] = {'total': 0, 'lt': 0, 'gt': 0}
-            current = total_dict[f'all']
-            current['total'] = len(self.tracks)
-            for t in self.tracks:
-                alfa, _ = t.basic_fit()
-                if alfa > 1.4:
-                    current['gt'] += 1
-                else:
-                    current['lt'] += 1
+            n_gt = int(gt.sum())
+            total_dict[f'all'] = {'total': len(self.tracks), 'lt': len(self.tracks) - n_gt, 'gt': n_gt}
 
         return _channels, total_dict
 
@@ -160,10 +293,21 @@ class Channel:
         return len(self.tracks)
 
     def get_track(self, track_id):
-        return self.tracks_hash_map.get(track_id, None)
+        row = self.track_rows.get(track_id, None)
+        if row is None or not self.mask[row]:
+            return None
+        return self.tracks_backup[row]
 
     def add_track(self, _track):
-        self.tracks.append(_track)
+        # added tracks are active whatever the filter
+        self.cache.clear()
+        self.track_rows[_track.track_id] = len(self.tracks_backup)
+        self.tracks_backup.append(_track)
+        self.backup_ids = np.append(self.backup_ids, _track.track_id)
+        self.track_lengths = np.append(self.track_lengths, len(_track))
+        self.track_ends = np.append(self.track_ends, _track.max_time_point)
+        self.mask = np.append(self.mask if self.mask is not None else np.zeros(0, dtype=bool), True)
+        self.tracks = TrackView(self.tracks_backup, np.flatnonzero(self.mask))
 
 
 if __name__ == '__main__':
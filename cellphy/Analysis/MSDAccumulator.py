@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from .msd import msd_at_lags, pack_positions
+from .stats import RunningStats
+from .fitting import FRAME_INTERVAL
+
+
+class MSDAccumulator:
+    """
+    Streaming time averaged and ensemble averaged MSD for lags 1 .. max_lag.
+
+    Tracks are consumed one chunk at a time and only per lag running
+    count/mean/M2 are kept, so any number of tracks, channels or files can be
+    folded in with constant memory.
+
+    time averaged: the msd curve of every track is one sample per lag.
+    ensemble averaged: |r(t0 + lag) - r(t0)|^2 from the first point of every
+    track is one sample per lag.
+    """
+
+    def __init__(self, max_lag=25, chunk_size=1000):
+        self.max_lag = max_lag
+        self.chunk_size = chunk_size
+        self.time_averaged = RunningStats(max_lag)
+        self.ensemble = RunningStats(max_lag)
+        self.tracks = 0
+
+    def add(self, positions):
+        self.add_tracks([positions])
+
+    def add_tracks(self, positions):
+        for start in range(0, len(positions), self.chunk_size):
+            self._add_chunk(positions[start:start + self.chunk_size])
+
+    def add_channel(self, channel):
+        self.add_tracks([t.positions for t in channel.tracks])
+
+    def _add_chunk(self, positions):
+        positions = [p for p in positions if len(p) > 1]
+        if not positions:
+            return
+        # only lags 1 .. max_lag are evaluated, memory stays O(points in the chunk)
+        offsets = np.concatenate(([0], np.cumsum([len(p) for p in positions])))
+        _msd, _ = msd_at_lags(np.concatenate(positions), np.arange(1, self.max_lag + 1), offsets)
+        self.time_averaged.add(_msd)
+
+        block, lengths = pack_positions(positions, limit=self.max_lag + 1)
+        displacement = np.square(block[:, 1:] - block[:, 0:1]).sum(axis=2)
+        observed = np.arange(1, block.shape[1])[None, :] < lengths[:, None]
+        self.ensemble.add(self._fit_width(np.where(observed, displacement, np.nan)))
+        self.tracks += len(positions)
+
+    def _fit_width(self, values):
+        result = np.full((len(values), self.max_lag), np.nan)
+        width = min(values.shape[1], self.max_lag)
+        result[:, 0:width] = values[:, 0:width]
+        return result
+
+    def to_frame(self, frame_interval=FRAME_INTERVAL):
+        lags = np.arange(1, self.max_lag + 1)
+        return pd.DataFrame({'tau': lags, 'time': lags * frame_interval,
+                             'ta_msd': self.time_averaged.get_mean(), 'ta_sem': self.time_averaged.get_sem(),
+                             'ta_count': self.time_averaged.count,
+                             'ea_msd': self.ensemble.get_mean(), 'ea_sem': self.ensemble.get_sem(),
+                             'ea_count': self.ensemble.count})
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from .colocalize import match_spots, pair_groups, build_pairs
+
+
+class RadiusSweep:
+    """
+    Co-localisation of two lists of tracks for many radii at once.
+
+    The matching spots (same frame, same direction) are found once for the
+    largest radius together with their squared distance; any smaller radius
+    only thresholds those distances. A track pair counts at radius r when at
+    least two of its spots are within r, i.e. from the second smallest
+    distance of the pair on.
+    """
+
+    def __init__(self, tracks_a, tracks_b, max_radius, callback=None, processes=1):
+        self.tracks_a = list(tracks_a)
+        self.tracks_b = list(tracks_b)
+        self.max_radius = max_radius
+        self.owner_a, self.owner_b, self.time, self.distance = match_spots(
+            self.tracks_a, self.tracks_b, max_radius, processes, callback)
+
+        # radius from which every (track a, track b) is a pair, inf for single spot matches
+        order, starts, ends = pair_groups(self.owner_a, self.owner_b, self.time, len(self.tracks_b))
+        self.thresholds = np.full(len(starts), np.inf)
+        for row, (start, end) in enumerate(zip(starts, ends)):
+            if end - start > 1:
+                self.thresholds[row] = np.partition(self.distance[order[start:end]], 1)[1]
+        # radius from which every spot is part of a pair: its own distance or its pair's threshold
+        spot_thresholds = np.empty(len(order))
+        spot_thresholds[order] = np.repeat(self.thresholds, ends - starts)
+        self.spot_thresholds = np.sort(np.maximum(self.distance, spot_thresholds))
+        self.thresholds.sort()
+
+    def _selected(self, radius):
+        # matched spots within radius
+        return np.flatnonzero(self.distance <= radius)
+
+    def pairs(self, radius):
+        # same TrackPairs as colocalized_pairs(tracks_a, tracks_b, radius) for any radius <= max_radius
+        rows = self._selected(radius)
+        return build_pairs(self.tracks_a, self.tracks_b, self.owner_a[rows], self.owner_b[rows], self.time[rows])
+
+    def spots(self, radius, suffix_a='_C0', suffix_b='_C1'):
+        """
+        One row per co-localised time point of the pairs at radius:
+        trackid{suffix_a}, trackid{suffix_b}, time and squared distance.
+        """
+        rows = self._selected(radius)
+        order, starts, ends = pair_groups(self.owner_a[rows], self.owner_b[rows], self.time[rows], len(self.tracks_b))
+        keep = np.concatenate([order[start:end] for start, end in zip(starts, ends) if end - start > 1] or
+                              [np.zeros(0, dtype=np.int64)])
+        rows = rows[keep]
+        ids_a = np.array([t.track_id for t in self.tracks_a])
+        ids_b = np.array([t.track_id for t in self.tracks_b])
+        return pd.DataFrame({f'trackid{suffix_a}': ids_a[self.owner_a[rows]] if len(ids_a) else [],
+                             f'trackid{suffix_b}': ids_b[self.owner_b[rows]] if len(ids_b) else [],
+                             'time': self.time[rows], 'distance': self.distance[rows]},
+                            columns=[f'trackid{suffix_a}', f'trackid{suffix_b}', 'time', 'distance'])
+
+    def counts(self, radii):
+        # number of pairs and of their co-localised spots (the rows of spots(radius)) for every radius
+        radii = np.asarray(radii, dtype=np.float64)
+        return pd.DataFrame({'radius': radii,
+                             'pairs': np.searchsorted(self.thresholds, radii, side='right'),
+                             'spots': np.searchsorted(self.spot_thresholds, radii, side='right')},
+                            columns=['radius', 'pairs', 'spots'])
@@ -10,7 +10,10 @@ from pathlib import Path
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
-from .functions import compare_tracks, get_msd_for_tracks, get_msd_fit
+from .functions import get_msd_for_tracks, get_msd_fit
+from .MSDAccumulator import MSDAccumulator
+from .loader import load_channels
+from .RadiusSweep import RadiusSweep
 
 
 def track_analyze(args):
@@ -26,13 +29,30 @@ def track_analyze(args):
             print('please provide a path for .csv file')
             sys.exit(1)
 
-    # create channels
-    channels = []
-    for csv_file in args.path:
-        channels.append(Channel(csv_file))
+    # create channels, the files are parsed concurrently
+    channels = load_channels(args.path)
 
-    an_df = compare_tracks(channels, args.radius, 0)
-    processed_file = os.path.abspath(os.path.join(data_file.parent.resolve(), f'processed_{data_file.name}'))
+    # one radius, or every radius of --sweep start stop step from a single pass
+    if args.sweep:
+        start, stop, step = args.sweep
+        radii = np.round(np.arange(start, stop + step / 2., step), 6)
+    else:
+        radii = np.array([args.radius])
+
+    for channel_a, channel_b in itertools.combinations(channels, 2):
+        print(f'processing channels {channel_a.name}{channel_a.suffix} & {channel_b.name}{channel_b.suffix}')
+        # --processes 0 uses every core
+        sweep = RadiusSweep(channel_a.tracks, channel_b.tracks, radii.max(), processes=args.processes or None)
+        name = f'{channel_a.suffix}{channel_b.suffix}_{data_file.name}'
+        for radius in radii:
+            processed_file = os.path.abspath(os.path.join(data_file.parent.resolve(),
+                                                          f'processed_r{radius:g}{name}'))
+            sweep.spots(radius, channel_a.suffix, channel_b.suffix).to_csv(processed_file, index=False)
+        if len(radii) > 1:
+            counts_file = os.path.abspath(os.path.join(data_file.parent.resolve(), f'processed_radius_counts{name}'))
+            sweep.counts(radii).to_csv(counts_file, index=False)
+
+    print(f'total time to analyze tracks {timer()-start_time}')
 
 
 def analyze_mean_stddev(args):
@@ -47,12 +67,39 @@ def analyze_mean_stddev(args):
     print("processing", data_file)
 
     channel = Channel(data_file)
-    time_map = channel.get_time_point_mean_and_stdev()
-
-    df = pd.DataFrame.from_dict(time_map, orient='index')
-    df.set_axis(['time', 'mean', 'stddev'], axis=1, inplace=True)
+    if args.sample:
+        # approximate: mean / stddev from args.sample random pairs per frame with their confidence bounds
+        stats = channel.get_time_point_sampled_stats(args.sample, seed=args.seed)
+        df = pd.DataFrame({'time': stats['time'], 'mean': stats['mean'], 'stddev': stats['stdev'],
+                           'mean_low': stats['mean_low'], 'mean_high': stats['mean_high'],
+                           'stddev_low': stats['stdev_low'], 'stddev_high': stats['stdev_high'],
+                           'pairs': stats['pairs'], 'sampled': stats['sampled']}, index=stats['time'])
+    else:
+        time_map = channel.get_time_point_mean_and_stdev()
+
+        df = pd.DataFrame.from_dict(time_map, orient='index')
+        df.set_axis(['time', 'mean', 'stddev'], axis=1, inplace=True)
     df.to_csv(processed_file)
 
+    if args.bin_width:
+        # fixed bins [0, bin_width, ..., bins * bin_width] of the distances per frame
+        edges = np.arange(args.bins + 1) * args.bin_width
+        stats = channel.get_time_point_distance_stats(bins=edges)
+        hist_df = pd.DataFrame(stats['histogram'], index=stats['time'],
+                               columns=[f'{lo:g}-{hi:g}' for lo, hi in zip(edges[:-1], edges[1:])])
+        hist_df.index.name = 'time'
+        hist_df.to_csv(os.path.abspath(os.path.join(data_file.parent.resolve(), f'histogram_{data_file.name}')))
+
+    if args.nn:
+        # one row per spot: its frame, track and the distances to its nn nearest spots
+        index = channel.frame_index()
+        distances = channel.nearest_neighbour_distances(args.nn)
+        track_ids = np.array([t.track_id for t in channel.tracks])
+        nn_df = pd.DataFrame(distances, columns=[f'nn_{i + 1}' for i in range(args.nn)])
+        nn_df.insert(0, 'trackid', track_ids[index.owner] if len(track_ids) else [])
+        nn_df.insert(0, 'time', index.time)
+        nn_df.to_csv(os.path.abspath(os.path.join(data_file.parent.resolve(), f'nn_{data_file.name}')), index=False)
+
     print(f'total time to analyze {timer()-start_time}')
 
 
@@ -87,11 +134,33 @@ def calculate_msd(args):
     df.to_csv(processed_file)
 
 
+def calculate_ensemble_msd(args):
+    start_time = timer()
+    for c_file in args.path:
+        if not (Path(c_file).suffix == '.csv'):
+            print('please provide a path for .csv file')
+            sys.exit(1)
+
+    data_file = Path(args.path[0])
+    processed_file = os.path.abspath(os.path.join(data_file.parent.resolve(),
+                                                  f'processed_ensemble_msd_{data_file.name}'))
+    print("output file", processed_file)
+
+    # one channel in memory at a time, the accumulator only keeps per lag sums
+    accumulator = MSDAccumulator(max_lag=args.max_lag)
+    for csv_file in args.path:
+        print("processing", csv_file)
+        accumulator.add_channel(Channel(csv_file))
+
+    accumulator.to_frame().to_csv(processed_file, index=False)
+    print(f'total time to ensemble msd {timer()-start_time}')
+
+
 def calculate_msb_by_bin(args):
     path = args
     start_time = timer()
 
-    if type(args) is not 'str':
+    if not isinstance(args, str):
         path = args.path
 
     data_file = Path(path)
@@ -108,11 +177,11 @@ def calculate_msb_by_bin(args):
     os.makedirs(curve_fit_dir, exist_ok=True)
     channel = Channel(data_file)
     print('binning and msd')
-    track_bins = channel.bin_tracks()
+    track_bins, total_dict = channel.bin_tracks()
     curve_data = {}
 
-    for bn, tb in track_bins.items():
-        tb_msd = get_msd_for_tracks(tb)
+    for bn, tb in zip(total_dict.keys(), track_bins):
+        tb_msd = get_msd_for_tracks(tb.tracks)
         processed_file_msd = os.path.abspath(os.path.join(msd_dir, f'processed_msd_{bn}_{data_file.name}'))
         print("msd output file", processed_file_msd)
         df1 = pd.DataFrame.from_dict(tb_msd, orient='index')
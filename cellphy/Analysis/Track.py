@@ -1,7 +1,11 @@
 from collections import OrderedDict
 import numpy as np
 from scipy.optimize import curve_fit
-import itertools
+from .msd import msd_fft, msd_time_lag, msd_at_lags, log_lags, msd_matrix
+from .TrackStore import TrackStore
+from .fitting import fit_power_law, lag_times, FRAME_INTERVAL
+from .cache import ResultCache
+from .ied import pdist, pdist_chunks, pdist_stats, CHUNK_SIZE
 
 
 def fit_function(delta, d, alfa):
@@ -16,76 +20,174 @@ def distance(a, b):
     return np.sqrt(np.sum((np.array(a) - np.array(b)) ** 2))
 
 
+def _frozen(value):
+    value.flags.writeable = False
+    return value
+
+
+def batch_fit(tracks, limit=26, frame_interval=FRAME_INTERVAL):
+    """
+    d and alfa of every track, taken from the track caches where possible.
+    The remaining tracks are fitted together in one msd_matrix/fit_power_law
+    pass and the msd curves and fits are stored back in their caches.
+    """
+    d = np.full(len(tracks), np.nan)
+    alfa = np.full(len(tracks), np.nan)
+    missing = []
+    for row, track in enumerate(tracks):
+        cached = track.cache.get(('fit', limit, frame_interval, None))
+        if cached is None:
+            missing.append(row)
+        else:
+            d[row], alfa[row] = cached
+
+    if missing:
+        _msd, counts = msd_matrix([tracks[row].positions for row in missing], limit=limit)
+        _d, _alfa = fit_power_law(_msd, lag_times(_msd.shape[1], frame_interval), refine='auto')
+        for i, row in enumerate(missing):
+            track = tracks[row]
+            track.cache.put(('msd', limit), _frozen(_msd[i][counts[i] > 0].copy()))
+            track.cache.put(('fit', limit, frame_interval, None), (_d[i], _alfa[i]))
+        d[missing] = _d
+        alfa[missing] = _alfa
+    return d, alfa
+
+
 class Track:
-    def __init__(self, track_id, name, color, suffix, raw_data=None, parent=None):
+    # a track is an immutable view on rows offsets[index]:offsets[index + 1] of a TrackStore; the store is never
+    # written after it is built, so cached results stay valid for the life of the track
+    __slots__ = ('parent', 'track_id', 'suffix', 'color', 'name', 'limit', 'store', 'index', 'cache')
+
+    def __init__(self, track_id, name, color, suffix, raw_data=None, parent=None, store=None, index=0):
         self.parent = parent
         self.track_id = track_id
-        self.raw_data = raw_data.copy().reset_index(drop=True)
         self.suffix = suffix
         self.color = color
 
+        if store is None:
+            store = TrackStore.from_frame(raw_data, suffix)
+        self.store = store
+        self.index = index
+
         self.name = f'{name}-{self.track_id}'
-        self.time_position_map = {}
         self.limit = 26
-        _time_position_map = {}
-        for index, row in self.raw_data.iterrows():
-            _time_position_map[int(row[['time']])] = list(row[[f'X{self.suffix}', f'Y{self.suffix}', f'Z{self.suffix}']])
-        self.time_position_map = OrderedDict(sorted(_time_position_map.items(), key=lambda t: t[0]))
-
-        self.max_time_point = self.raw_data['time'].max()
+        self.cache = ResultCache()
 
     def __str__(self):
         return f'{self.track_id}-{self.suffix}'
 
+    def __len__(self):
+        return int(self.store.offsets[self.index + 1] - self.store.offsets[self.index])
+
+    @property
+    def positions(self):
+        return self.store.positions[self.store.track_slice(self.index)]
+
+    @property
+    def time(self):
+        return self.store.time[self.store.track_slice(self.index)]
+
+    @property
+    def max_time_point(self):
+        return self.time[-1]
+
+    @property
+    def raw_data(self):
+        return self.get_values()
+
+    @property
+    def time_position_map(self):
+        return OrderedDict(zip(self.time.tolist(), self.positions.tolist()))
+
+    def cache_info(self):
+        return self.cache.info()
+
     def get_track_id(self):
         return self.track_id
 
     def get_values(self):
-        return self.raw_data
+        return self.store.to_frame(self.index, self.suffix)
 
     def get_position_by_time_point(self, time_point):
-        if time_point in self.time_position_map.keys():
-            return self.time_position_map[time_point]
+        time = self.time
+        index = np.searchsorted(time, time_point)
+        if index < len(time) and time[index] == time_point:
+            return self.positions[index].tolist()
         else:
             return None
 
-    def msd(self, limit=26, diff=distance):
+    def msd(self, limit=26, by_time=False):
         # 26 ~= 100 sec (3.8)
+        # by_time pairs positions by their real time difference, so lag j+1 is
+        # j+1 frames even when the track misses frames; lags without pairs are NaN
         self.limit = limit
-        _track = list(self.time_position_map.values())
-        if limit:
-            _track = _track[0:limit]
-        tau = 1
-        while tau < len(_track):
-            msd_t = 0
-            r = len(_track) - tau
-            for i in range(r):
-                msd_t += np.square(diff(_track[i + tau], _track[i])).item()
-            _mean = msd_t / float(len(_track) - tau)
-            yield _mean
-            tau += 1
-
-    def ied_distance(self):
-        for p1, p2 in itertools.combinations(list(self.time_position_map.values()), 2):
-            yield distance(p1, p2)
-
-    def basic_fit(self):
-
-        y = np.array(list(self.msd(limit=self.limit)))
-        x = np.array(list(range(1, len(y) + 1))) * 3.8
-
-        init = np.array([.001, .01])
-        best_value, _ = curve_fit(fit_function, x, y, p0=init, maxfev=10000)
+        key = ('msd_time' if by_time else 'msd', limit)
+        result = self.cache.get(key)
+        if result is None:
+            if by_time:
+                time = self.time
+                window = (time - time[0]) < limit if limit else slice(None)
+                _, result, _ = msd_time_lag(self.positions[window], time[window],
+                                            max_lag=limit - 1 if limit else None)
+            else:
+                result = msd_fft(self.positions, limit=limit)
+            result = self.cache.put(key, _frozen(result))
+        return result
+
+    def log_msd(self, n_lags=20):
+        # (lags, msd) of the whole track at log spaced lags only
+        key = ('msd_log', n_lags)
+        result = self.cache.get(key)
+        if result is None:
+            lags = log_lags(len(self) - 1, n_lags)
+            result = self.cache.put(key, (_frozen(lags), _frozen(msd_at_lags(self.positions, lags))))
+        return result
+
+    def time_lag_msd(self, max_lag=None):
+        # (lags, msd, counts) over the whole track, see msd_time_lag
+        return msd_time_lag(self.positions, self.time, max_lag=max_lag)
+
+    def ied_distance(self, chunk_size=CHUNK_SIZE):
+        # condensed (scipy pdist order) array of the distances between all positions
+        return pdist(self.positions, chunk_size)
+
+    def ied_chunks(self, chunk_size=CHUNK_SIZE):
+        return pdist_chunks(self.positions, chunk_size)
+
+    def ied_stats(self, chunk_size=CHUNK_SIZE):
+        # count, mean, stdev, min and max without materialising all the pairs
+        return pdist_stats(self.positions, chunk_size)
+
+    def _fit_points(self, frame_interval, by_time, n_log_lags):
+        if n_log_lags:
+            lags, y = self.log_msd(n_lags=n_log_lags)
+            return lags * frame_interval, y
+        y = self.msd(limit=self.limit, by_time=by_time)
+        return lag_times(len(y), frame_interval), y
+
+    def basic_fit(self, frame_interval=FRAME_INTERVAL, by_time=False, n_log_lags=None):
+        # n_log_lags fits the whole track on that many log spaced lags instead of the first self.limit
+        key = ('fit_time' if by_time else 'fit', self.limit, frame_interval, n_log_lags)
+        best_value = self.cache.get(key)
+        x, y = self._fit_points(frame_interval, by_time, n_log_lags)
+
+        if best_value is None:
+            d, alfa = fit_power_law(y, x, refine='auto')
+            best_value = self.cache.put(key, (d[0], alfa[0]))
         _y = fit_function(x, best_value[0], best_value[1])
 
         return best_value[1], _y
 
-    def velocity_fit(self):
-        y = np.array(list(self.msd(limit=self.limit)))
-        x = np.array(list(range(1, len(y) + 1))) * 3.8
+    def velocity_fit(self, frame_interval=FRAME_INTERVAL, by_time=False, n_log_lags=None):
+        key = ('velocity_time' if by_time else 'velocity', self.limit, frame_interval, n_log_lags)
+        best_value = self.cache.get(key)
+        x, y = self._fit_points(frame_interval, by_time, n_log_lags)
 
-        init = np.array([.001, .01, .01])
-        best_value, _ = curve_fit(fit_velocity_function, x, y, p0=init, maxfev=1000000)
+        if best_value is None:
+            init = np.array([.001, .01, .01])
+            observed = np.isfinite(y)
+            best_value, _ = curve_fit(fit_velocity_function, x[observed], y[observed], p0=init, maxfev=1000000)
+            best_value = self.cache.put(key, tuple(best_value))
         _y = fit_velocity_function(x, best_value[0], best_value[1], best_value[2])
 
-        return best_value[1], best_value[2], _y
\ No newline at end of file
+        return best_value[1], best_value[2], _y
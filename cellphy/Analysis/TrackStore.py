@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+
+
+class TrackStore:
+    """
+    Columnar storage for all the spots of a channel.
+
+    positions (N, 3) and time (N,) are sorted by (trackid, time), so every track
+    is the contiguous block offsets[i]:offsets[i + 1] and track_ids[i] is its id.
+    Tracks only keep an index into the store and read their data as views.
+    """
+
+    def __init__(self, positions, time, track_ids, offsets):
+        self.positions = positions
+        self.time = time
+        self.track_ids = track_ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, positions, time, trackid):
+        positions = np.asarray(positions)
+        time = np.asarray(time)
+        trackid = np.asarray(trackid)
+
+        # exports usually come grouped by track already, then one O(N) check
+        # replaces the sort; otherwise sort once by (trackid, time)
+        step = np.diff(trackid)
+        if not (np.all(step >= 0) and np.all((step > 0) | (np.diff(time) > 0))):
+            order = np.lexsort((time, trackid))
+            positions = positions[order]
+            time = time[order]
+            trackid = trackid[order]
+            step = np.diff(trackid)
+        positions = np.ascontiguousarray(positions)
+
+        starts = np.flatnonzero(step) + 1
+        offsets = np.concatenate(([0], starts, [len(trackid)] if len(trackid) else [])).astype(np.int64)
+        track_ids = trackid[offsets[:-1]]
+        return cls(positions, time, track_ids, offsets)
+
+    @classmethod
+    def from_frame(cls, data, suffix):
+        positions = data[[f'X{suffix}', f'Y{suffix}', f'Z{suffix}']].values
+        return cls.from_arrays(positions, data['time'].values, data[f'trackid{suffix}'].values)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    @property
+    def x(self):
+        return self.positions[:, 0]
+
+    @property
+    def y(self):
+        return self.positions[:, 1]
+
+    @property
+    def z(self):
+        return self.positions[:, 2]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def track_slice(self, index):
+        return slice(self.offsets[index], self.offsets[index + 1])
+
+    def gather(self, rows):
+        # positions and time of the tracks rows, back to back, and the position in rows owning every spot
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.offsets[rows + 1] - self.offsets[rows]
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        first = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        spots = self.offsets[rows][owner] + np.arange(len(owner)) - first[owner]
+        return self.positions[spots], self.time[spots], owner
+
+    def bounds(self, rows):
+        # (t_min, t_max, low, high) of the tracks rows, as colocalize.track_bounds gives for their Tracks
+        rows = np.asarray(rows, dtype=np.int64)
+        n = len(rows)
+        t_min, t_max = np.full(n, np.inf), np.full(n, -np.inf)
+        low, high = np.zeros((n, 3)), np.zeros((n, 3))
+        filled = self.offsets[rows + 1] > self.offsets[rows]
+        rows = rows[filled]
+        if len(rows):
+            positions, _, owner = self.gather(rows)
+            starts = np.flatnonzero(np.concatenate(([True], owner[1:] != owner[:-1])))
+            t_min[filled] = self.time[self.offsets[rows]]
+            t_max[filled] = self.time[self.offsets[rows + 1] - 1]
+            low[filled] = np.minimum.reduceat(positions, starts, axis=0)
+            high[filled] = np.maximum.reduceat(positions, starts, axis=0)
+        return t_min, t_max, low, high
+
+    def to_frame(self, index, suffix):
+        # one track, or every spot of the store when index is None
+        _slice = self.track_slice(index) if index is not None else slice(None)
+        positions = self.positions[_slice]
+        data = pd.DataFrame({f'X{suffix}': positions[:, 0], f'Y{suffix}': positions[:, 1],
+                             f'Z{suffix}': positions[:, 2], 'time': self.time[_slice]})
+        if index is not None:
+            data[f'trackid{suffix}'] = self.track_ids[index]
+        else:
+            data[f'trackid{suffix}'] = np.repeat(self.track_ids, self.lengths())
+        return data
+
+
+class FrameIndex:
+    """
+    Spots of a set of tracks ordered by time, for per frame queries.
+
+    positions, time and owner (row of the track in the list the index was
+    built from) are argsorted by time once; frame i is the contiguous block
+    offsets[i]:offsets[i + 1] so any frame is a zero copy slice.
+    """
+
+    def __init__(self, positions, time, owner):
+        order = np.argsort(time, kind='mergesort')
+        self.positions = np.ascontiguousarray(positions[order])
+        self.time = time[order]
+        self.owner = owner[order]
+        self.frames = np.unique(self.time)
+        self.offsets = np.concatenate((np.searchsorted(self.time, self.frames), [len(self.time)])).astype(np.int64)
+
+    @classmethod
+    def from_tracks(cls, tracks, rows=None):
+        # owner of a spot is the position of its track in tracks, or rows[position] when given
+        if not len(tracks):
+            return cls(np.zeros((0, 3)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        lengths = [len(t) for t in tracks]
+        rows = np.arange(len(tracks)) if rows is None else np.asarray(rows, dtype=np.int64)
+        owner = np.repeat(rows, lengths)
+        return cls(np.concatenate([t.positions for t in tracks]), np.concatenate([t.time for t in tracks]), owner)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame_slice(self, time_point):
+        index = np.searchsorted(self.frames, time_point)
+        if index < len(self.frames) and self.frames[index] == time_point:
+            return slice(self.offsets[index], self.offsets[index + 1])
+        return slice(0, 0)
+
+    def positions_at(self, time_point):
+        return self.positions[self.frame_slice(time_point)]
+
+    def owners_at(self, time_point):
+        return self.owner[self.frame_slice(time_point)]
+
+    def items(self):
+        # (time point, positions view) for every frame with at least one spot
+        for index, time_point in enumerate(self.frames):
+            yield time_point, self.positions[self.offsets[index]:self.offsets[index + 1]]
+
+
+class TrackView:
+    """
+    Read only sequence of source[i] for every i of an index array, so a
+    filtered set of tracks is an np.flatnonzero of a mask, not a new list.
+    """
+    __slots__ = ('source', 'index')
+
+    def __init__(self, source, index):
+        self.source = source
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        source = self.source
+        for i in self.index:
+            yield source[i]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return TrackView(self.source, self.index[item])
+        return self.source[self.index[item]]
+
+    def copy(self):
+        return list(self)
+
+
+class LazyTracks:
+    """
+    Sequence of tracks where item i is built by factory(rows[i]) the first
+    time it is accessed and kept after that; appended tracks are stored as is.
+    """
+    __slots__ = ('factory', 'rows', 'items')
+
+    def __init__(self, factory, rows):
+        self.factory = factory
+        self.rows = rows
+        self.items = [None] * len(rows)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        item = self.items[index]
+        if item is None:
+            item = self.items[index] = self.factory(self.rows[index])
+        return item
+
+    def __iter__(self):
+        for index in range(len(self.items)):
+            yield self[index]
+
+    def append(self, item):
+        self.items.append(item)
+
+    def built(self):
+        # only the tracks accessed so far
+        return [item for item in self.items if item is not None]
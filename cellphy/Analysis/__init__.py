@@ -1,3 +1,5 @@
 from .Track import Track
 from .Channel import Channel
-from .TrackPair import TrackPair
\ No newline at end of file
+from .TrackPair import TrackPair
+from .TrackStore import TrackStore
+from .MSDAccumulator import MSDAccumulator
@@ -0,0 +1,34 @@
+class ResultCache:
+    """
+    Small memo table for computed results (msd curves, fits, ...).
+
+    Lookups are counted so callers can check how often work was reused,
+    clear() drops every entry but keeps the counters.
+    """
+    __slots__ = ('entries', 'hits', 'misses')
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key, None)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        return value
+
+    def clear(self):
+        self.entries = {}
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
@@ -0,0 +1,224 @@
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from scipy.spatial import cKDTree
+from .TrackStore import FrameIndex
+from .TrackPair import TrackPair
+from .functions import sub_track, compare_tracks
+
+
+def frame_trees(index):
+    # time point -> cKDTree of the spots of that frame
+    return {time_point: cKDTree(positions.astype(np.float64)) for time_point, positions in index.items()}
+
+
+def colocalized_spots(index_a, index_b, radius, callback=None, trees_b=None):
+    """
+    Every pair of spots of two FrameIndex objects that are together: same
+    frame, positive dot product of the positions and squared distance <=
+    radius (the compare_tracks test). Walks the frames once and queries a
+    KD-tree of the frame's b spots with a ball of sqrt(radius); trees_b, from
+    frame_trees(index_b), saves building those trees again.
+
+    Returns owner_a, owner_b, time and squared distance arrays, one entry per
+    matching pair of spots. callback(done, total) is called after every frame.
+    """
+    owners_a, owners_b, times, distances = [], [], [], []
+    common = np.intersect1d(index_a.frames, index_b.frames)
+    # a tiny margin so no pair at exactly the radius is lost to rounding, the exact test follows
+    max_distance = np.sqrt(radius) * (1. + 1e-9)
+    for done, time_point in enumerate(common):
+        _slice_a = index_a.frame_slice(time_point)
+        _slice_b = index_b.frame_slice(time_point)
+        p1 = index_a.positions[_slice_a].astype(np.float64)
+        p2 = index_b.positions[_slice_b].astype(np.float64)
+        tree_b = trees_b[time_point] if trees_b is not None else cKDTree(p2)
+        near = cKDTree(p1).sparse_distance_matrix(tree_b, max_distance, output_type='ndarray')
+        i, j = near['i'], near['j']
+        dot = np.square(p1[i] - p2[j]).sum(axis=1)
+        keep = (np.einsum('ij,ij->i', p1[i], p2[j]) > 0) & (dot <= radius)
+        owners_a.append(index_a.owner[_slice_a][i[keep]])
+        owners_b.append(index_b.owner[_slice_b][j[keep]])
+        times.append(np.full(keep.sum(), time_point))
+        distances.append(dot[keep])
+        if callback is not None:
+            callback(done + 1, len(common))
+
+    if not len(common):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    return np.concatenate(owners_a), np.concatenate(owners_b), np.concatenate(times), np.concatenate(distances)
+
+
+# chunks handed to every worker process, and the fewest tracks worth a chunk
+CHUNKS_PER_PROCESS = 4
+MIN_CHUNK_SIZE = 16
+
+# FrameIndex of channel b, its per frame KD-trees and the radius, set once per worker process
+_worker = None
+
+
+def _init_worker(positions, time, owner, radius):
+    global _worker
+    index_b = FrameIndex(positions, time, owner)
+    _worker = (index_b, frame_trees(index_b), radius)
+
+
+def _match_chunk(chunk):
+    positions, time, owner = chunk
+    index_b, trees_b, radius = _worker
+    return colocalized_spots(FrameIndex(positions, time, owner), index_b, radius, trees_b=trees_b)
+
+
+def _track_arrays(tracks, first_row=0):
+    # concatenated positions / time of the tracks and the row (first_row + i) owning every spot
+    if not len(tracks):
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    owner = np.repeat(np.arange(first_row, first_row + len(tracks)), [len(t) for t in tracks])
+    return np.concatenate([t.positions for t in tracks]), np.concatenate([t.time for t in tracks]), owner
+
+
+def chunk_size(n_tracks, processes=None):
+    # tracks per chunk so every process gets about CHUNKS_PER_PROCESS chunks, processes None: all cores
+    processes = processes or cpu_count()
+    return max(int(np.ceil(n_tracks / float(CHUNKS_PER_PROCESS * processes))), MIN_CHUNK_SIZE)
+
+
+def colocalized_spots_parallel(tracks_a, tracks_b, radius, processes=None, size=None, callback=None):
+    """
+    colocalized_spots of two lists of tracks with tracks_a split in chunks of
+    size tracks (default from chunk_size) handled by a process pool. Every
+    worker receives the arrays of tracks_b once, when it starts, and builds
+    their KD-trees once; a task only carries its chunk. callback(done, total)
+    is called as every chunk comes back.
+    """
+    tracks_a = list(tracks_a)
+    size = size or chunk_size(len(tracks_a), processes)
+    chunks = [_track_arrays(tracks_a[start:start + size], start) for start in range(0, len(tracks_a), size)]
+    results = []
+    # no more workers than chunks, each of them builds the trees of tracks_b
+    processes = min(processes or cpu_count(), max(len(chunks), 1))
+    with Pool(processes, initializer=_init_worker, initargs=_track_arrays(list(tracks_b)) + (radius,)) as pool:
+        for done, result in enumerate(pool.imap_unordered(_match_chunk, chunks)):
+            results.append(result)
+            if callback is not None:
+                callback(done + 1, len(chunks))
+
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(column) for column in zip(*results))
+
+
+def match_spots(tracks_a, tracks_b, radius, processes=1, callback=None):
+    # colocalized_spots of two track lists, in a process pool unless no process would get more than one chunk
+    tracks_a = list(tracks_a)
+    processes = processes or cpu_count()
+    n_chunks = int(np.ceil(len(tracks_a) / float(chunk_size(len(tracks_a), processes))))
+    if n_chunks <= processes:
+        return colocalized_spots(FrameIndex.from_tracks(tracks_a), FrameIndex.from_tracks(tracks_b), radius, callback)
+    return colocalized_spots_parallel(tracks_a, tracks_b, radius, processes, callback=callback)
+
+
+def pair_groups(owner_a, owner_b, time, n_b):
+    """
+    Sorts matched spots by (owner_a, owner_b, time); returns that order and
+    the start / end of every (owner_a, owner_b) run in it.
+    """
+    key = owner_a.astype(np.int64) * n_b + owner_b
+    order = np.lexsort((time, key))
+    key = key[order]
+    starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1]))) if len(key) else np.zeros(0, np.int64)
+    ends = np.concatenate((starts[1:], [len(key)])) if len(key) else np.zeros(0, np.int64)
+    return order, starts, ends
+
+
+def build_pairs(tracks_a, tracks_b, owner_a, owner_b, time):
+    # TrackPair of every (owner_a, owner_b) with more than one matched time point
+    order, starts, ends = pair_groups(owner_a, owner_b, time, len(tracks_b))
+    pairs = []
+    for start, end in zip(starts, ends):
+        if end - start < 2:
+            continue
+        rows = order[start:end]
+        _time = time[rows]
+        pairs.append(TrackPair(sub_track(tracks_a[owner_a[rows[0]]], _time),
+                               sub_track(tracks_b[owner_b[rows[0]]], _time), _time.tolist()))
+    return pairs
+
+
+def colocalized_pairs(tracks_a, tracks_b, radius, callback=None, processes=1):
+    """
+    TrackPair of every (track_a, track_b) together on more than one time
+    point, the same pairs compare_tracks gives for every combination of the
+    two lists, ordered by their position in tracks_a then tracks_b.
+    processes other than 1 spreads the work over a process pool (None: all cores).
+    """
+    tracks_a = list(tracks_a)
+    tracks_b = list(tracks_b)
+    owner_a, owner_b, time, _ = match_spots(tracks_a, tracks_b, radius, processes, callback)
+    return build_pairs(tracks_a, tracks_b, owner_a, owner_b, time)
+
+
+def track_bounds(tracks):
+    """
+    (t_min, t_max, low, high) of a list of tracks: first and last time
+    point and the (n, 3) corners of the axis aligned box around each track.
+    """
+    n = len(tracks)
+    t_min, t_max = np.zeros(n), np.zeros(n)
+    low, high = np.zeros((n, 3)), np.zeros((n, 3))
+    for row, track in enumerate(tracks):
+        time = track.time
+        positions = track.positions
+        if not len(time):
+            t_min[row], t_max[row] = np.inf, -np.inf
+            continue
+        t_min[row], t_max[row] = time[0], time[-1]
+        low[row], high[row] = positions.min(axis=0), positions.max(axis=0)
+    return t_min, t_max, low, high
+
+
+def candidate_pairs(bounds_a, bounds_b, radius):
+    """
+    Rows (ia, ib) of the track pairs that can pass compare_tracks: their time
+    intervals overlap and their boxes, grown by sqrt(radius), intersect.
+    Sweeps over the tracks of b sorted by first time point; sorted by ia, ib.
+    """
+    t_min_a, t_max_a, low_a, high_a = bounds_a
+    t_min_b, t_max_b, low_b, high_b = bounds_b
+    reach = np.sqrt(radius)
+    order = np.argsort(t_min_b, kind='mergesort')
+    starts = t_min_b[order]
+
+    rows_a, rows_b = [], []
+    for row in range(len(t_min_a)):
+        # b tracks starting before a ends, of those the ones still running when a starts
+        rows = order[:np.searchsorted(starts, t_max_a[row], side='right')]
+        rows = rows[t_max_b[rows] >= t_min_a[row]]
+        near = np.all((low_b[rows] <= high_a[row] + reach) & (high_b[rows] >= low_a[row] - reach), axis=1)
+        rows = np.sort(rows[near])
+        rows_a.append(np.full(len(rows), row, dtype=np.int64))
+        rows_b.append(rows)
+
+    if not rows_a:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows_a), np.concatenate(rows_b).astype(np.int64)
+
+
+def compare_track_lists(tracks_a, tracks_b, radius, bounds_a=None, bounds_b=None, callback=None):
+    """
+    compare_tracks for the pairs of tracks_a x tracks_b left by candidate_pairs,
+    the TrackPairs in tracks_a then tracks_b order. callback(done, total) is
+    called after each candidate.
+    """
+    bounds_a = bounds_a if bounds_a is not None else track_bounds(tracks_a)
+    bounds_b = bounds_b if bounds_b is not None else track_bounds(tracks_b)
+    rows_a, rows_b = candidate_pairs(bounds_a, bounds_b, radius)
+    pairs = []
+    for done, (row_a, row_b) in enumerate(zip(rows_a, rows_b)):
+        track_a = tracks_a[row_a]
+        track_b = tracks_b[row_b]
+        pair = compare_tracks(track_a, track_b, track_a.suffix, track_b.suffix, radius)
+        if pair is not None:
+            pairs.append(pair)
+        if callback is not None:
+            callback(done + 1, len(rows_a))
+    return pairs
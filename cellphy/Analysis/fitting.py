@@ -0,0 +1,158 @@
+import numpy as np
+
+# seconds between two frames
+FRAME_INTERVAL = 3.8
+# alfa values the tracks are classified by; with refine='auto' rows whose log-log alfa is within
+# REFINE_MARGIN of one of them, or whose log-log fit is poor, are refined
+ALFA_CUTOFFS = (0.4, 1.2, 1.4)
+REFINE_MARGIN = 0.1
+REFINE_RESIDUAL = 0.3
+
+
+def lag_times(n_lags, frame_interval=FRAME_INTERVAL):
+    return np.arange(1, n_lags + 1) * frame_interval
+
+
+def power_law(lag_time, d, alfa):
+    # msd = 4 d t^alfa for every row of d / alfa
+    d = np.asarray(d, dtype=np.float64)
+    alfa = np.asarray(alfa, dtype=np.float64)
+    return (4 * d)[..., None] * np.power(lag_time, alfa[..., None])
+
+
+def _log_fit(msd, lag_time, weights):
+    lx = np.log(np.broadcast_to(lag_time, msd.shape))
+    valid = np.isfinite(msd) & (msd > 0)
+    ly = np.log(np.where(valid, msd, 1.))
+    w = np.where(valid, weights, 0.)
+
+    sw = w.sum(axis=1)
+    safe_sw = np.where(sw > 0, sw, 1.)
+    mx = (w * lx).sum(axis=1) / safe_sw
+    my = (w * ly).sum(axis=1) / safe_sw
+    sxx = (w * np.square(lx - mx[:, None])).sum(axis=1)
+    sxy = (w * (lx - mx[:, None]) * (ly - my[:, None])).sum(axis=1)
+
+    solved = (valid.sum(axis=1) > 1) & (sxx > 0)
+    alfa = np.where(solved, sxy / np.where(solved, sxx, 1.), np.nan)
+    log_c = np.where(solved, my - alfa * mx, np.nan)
+    return log_c, alfa
+
+
+def refine_rows(msd, lag_time, log_c, alfa, weights):
+    """
+    Rows of a log-log fit that the Levenberg-Marquardt step can change in a
+    way that matters: alfa near one of ALFA_CUTOFFS, or a weighted rms log
+    residual above REFINE_RESIDUAL (the power law is a poor fit and the two
+    objectives disagree most).
+    """
+    lx = np.log(np.broadcast_to(lag_time, msd.shape))
+    valid = np.isfinite(msd) & (msd > 0)
+    w = np.where(valid, weights, 0.)
+    residual = np.where(valid, np.log(np.where(valid, msd, 1.)) - (log_c[:, None] + alfa[:, None] * lx), 0.)
+    sw = w.sum(axis=1)
+    rms = np.sqrt((w * np.square(residual)).sum(axis=1) / np.where(sw > 0, sw, 1.))
+
+    near = np.zeros(len(alfa), dtype=bool)
+    for cutoff in ALFA_CUTOFFS:
+        near |= np.abs(alfa - cutoff) < REFINE_MARGIN
+    return np.isfinite(alfa) & (near | (rms > REFINE_RESIDUAL))
+
+
+def _refine(msd, lag_time, log_c, alfa, max_iter, tol):
+    # batched Levenberg-Marquardt on sum((msd - exp(log_c) t^alfa)^2), the same
+    # objective curve_fit minimises, started from the log-log solution
+    lx = np.log(np.broadcast_to(lag_time, msd.shape))
+    valid = np.isfinite(msd)
+    y = np.where(valid, msd, 0.)
+
+    def residuals(_log_c, _alfa, rows):
+        model = np.exp(_log_c[:, None] + _alfa[:, None] * lx[rows])
+        return np.where(valid[rows], y[rows] - model, 0.), model
+
+    log_c = log_c.copy()
+    alfa = alfa.copy()
+    damping = np.full(len(alfa), 1e-3)
+    active = np.flatnonzero(np.isfinite(alfa) & np.isfinite(log_c))
+    res, model = residuals(log_c[active], alfa[active], active)
+    cost = np.square(res).sum(axis=1)
+
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        jc = np.where(valid[active], model, 0.)
+        ja = jc * lx[active]
+        a11 = (jc * jc).sum(axis=1)
+        a12 = (jc * ja).sum(axis=1)
+        a22 = (ja * ja).sum(axis=1)
+        g1 = (jc * res).sum(axis=1)
+        g2 = (ja * res).sum(axis=1)
+
+        lam = damping[active]
+        b11 = a11 * (1 + lam)
+        b22 = a22 * (1 + lam)
+        det = b11 * b22 - a12 * a12
+        det = np.where(det != 0, det, np.finfo(np.float64).tiny)
+        step_c = (b22 * g1 - a12 * g2) / det
+        step_a = (b11 * g2 - a12 * g1) / det
+
+        new_c = log_c[active] + step_c
+        new_a = alfa[active] + step_a
+        new_res, new_model = residuals(new_c, new_a, active)
+        new_cost = np.square(new_res).sum(axis=1)
+
+        better = np.isfinite(new_cost) & (new_cost <= cost)
+        log_c[active[better]] = new_c[better]
+        alfa[active[better]] = new_a[better]
+        damping[active] = np.where(better, lam / 10, lam * 10)
+        res = np.where(better[:, None], new_res, res)
+        model = np.where(better[:, None], new_model, model)
+
+        step = np.abs(step_c) + np.abs(step_a)
+        converged = (better & (step < tol * (1 + np.abs(alfa[active])))) | (damping[active] > 1e10)
+        cost = np.where(better, new_cost, cost)
+
+        keep = ~converged
+        active, res, model, cost = active[keep], res[keep], model[keep], cost[keep]
+
+    return log_c, alfa
+
+
+def fit_power_law(msd, lag_time, weights=None, refine=False, max_iter=100, tol=1e-10):
+    """
+    Fit msd = 4 d t^alfa to every row of an (n_tracks, n_lags) MSD matrix.
+
+    The fit is one weighted least squares solve of log(msd) against log(t)
+    over all rows. NaN and non positive values are skipped, so the padded
+    output of msd_matrix can be used as is. The default weights, msd^2, make
+    the log residuals approximate the linear residuals curve_fit minimises.
+
+    refine (True, 'auto' or a boolean row mask) polishes the selected rows
+    with a batched Levenberg-Marquardt on the linear residuals, which gives
+    the same result as a per track scipy curve_fit. Rows leave the iteration
+    as soon as they converge. 'auto' selects the rows of refine_rows.
+
+    Returns d and alfa arrays, NaN for rows with less than two usable points.
+    """
+    msd = np.atleast_2d(np.asarray(msd, dtype=np.float64))
+    lag_time = np.asarray(lag_time, dtype=np.float64)
+    if weights is None:
+        weights = np.square(np.where(np.isfinite(msd), msd, 0.))
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), msd.shape)
+
+    log_c, alfa = _log_fit(msd, lag_time, weights)
+
+    if refine is not False:
+        if refine is True:
+            rows = np.arange(len(alfa))
+        elif isinstance(refine, str) and refine == 'auto':
+            rows = np.flatnonzero(refine_rows(msd, lag_time, log_c, alfa, weights))
+        else:
+            rows = np.flatnonzero(refine)
+        if len(rows):
+            _log_c, _alfa = _refine(msd[rows], np.broadcast_to(lag_time, msd.shape)[rows],
+                                    log_c[rows], alfa[rows], max_iter, tol)
+            log_c[rows] = _log_c
+            alfa[rows] = _alfa
+
+    return np.exp(log_c) / 4, alfa
@@ -1,12 +1,14 @@
 import numpy as np
 from scipy import optimize
-import operator
 import pandas as pd
 import matplotlib.pyplot as plt
 from functools import reduce
 import itertools
 from .TrackPair import TrackPair
 from .Track import Track
+from .TrackStore import TrackStore
+from .msd import msd_fft, msd_matrix
+from .fitting import fit_power_law, lag_times
 
 
 def distance(a, b):
@@ -33,14 +35,19 @@ def get_msd_fit(_tp_msd, art):
     track_curve_fit = {}
     lgh = []
     f, (pl1, pl2) = plt.subplots(1, 2, sharey=True)
-    for track_id, track_msd in _tp_msd.items():
-        # print("track_msd", track_msd)
+
+    # fit every track at once, d * x^t is the 4d convention of fit_power_law
+    _msd = np.full((len(_tp_msd), 26), np.nan)
+    for row, track_msd in enumerate(_tp_msd.values()):
+        y = np.array(track_msd)[0:26]
+        _msd[row, 0:len(y)] = y
+    _d, _alfa = fit_power_law(_msd, lag_times(26), refine='auto')
+
+    for row, (track_id, track_msd) in enumerate(_tp_msd.items()):
         y = np.array(track_msd)
         y = y[0:26]
-        # print(f"len(y) {track_id} ", len(y))
-        init = np.array([.001, .01])
-        x = np.array(list(range(1, len(y)+1)))*3.8
-        best_value, covar = optimize.curve_fit(fit_function, x, y, p0=init, maxfev=10000)
+        x = lag_times(len(y))
+        best_value = np.array([4 * _d[row], _alfa[row]])
         # plt.subplot(2, 1, 2)
         pl1col = pl1.scatter(x, y, label="Data")
         lg_handler, = pl1.plot(x, fit_function(x, best_value[0], best_value[1]),
@@ -68,23 +75,16 @@ def plot_curve(y):
 
 
 def get_msd_for_tracks(_tracks):
+    _tracks = [_track for _track in _tracks if len(_track.positions) > 5]
+    track_msd, counts = msd_matrix([_track.positions for _track in _tracks])
     track_msd_map = {}
-    for _track in _tracks:
-        if len(_track.points) > 5:
-            track_msd_map[str(_track.track_id)] = list(msd(_track.points, diff=distance))
+    for _track, _msd, _count in zip(_tracks, track_msd, counts):
+        track_msd_map[str(_track.track_id)] = _msd[_count > 0]
     return track_msd_map
 
 
-def msd(_track, diff=operator.sub):
-    tau = 1
-    while tau < len(_track):
-        msd_t = 0
-        r = len(_track)-tau
-        for i in range(r):
-            msd_t += np.square(diff(_track[i+tau], _track[i])).item()
-        _mean = msd_t/float(len(_track)-tau)
-        yield _mean
-        tau += 1
+def msd(_track):
+    return msd_fft(_track)
 
 
 def data_frame_splitter(df, column_name):
@@ -100,85 +100,41 @@ def data_frame_splitter(df, column_name):
         work = work.drop(work.index[work.index.size - 1])
 
 
-def compare_tracks(track_a, track_b, suffix_a, suffix_b, _radius):
+def match_tracks(track_a, track_b, radius):
+    """
+    Co-localisation of two tracks on their common time points, in time order.
 
-    result = None
+    Returns (time, mask, distance): mask is True where the positions point
+    the same way (positive dot product) and their squared distance is
+    <= radius, distance is that squared distance.
+    """
+    time_a = track_a.time
+    time_b = track_b.time
+    index_a = np.flatnonzero(np.in1d(time_a, time_b))
+    index_b = np.searchsorted(time_b, time_a[index_a])
 
-    # pandas apply function
-    def apply_sphere(radius, sfl, sfr):
-        def check_sphere(x):
-            p1 = np.array([x[f'X{sfl}'], x[f'Y{sfl}'], x[f'Z{sfl}']])
-            p2 = np.array([x[f'X{sfr}'], x[f'Y{sfr}'], x[f'Z{sfr}']])
-            val = p1 - p2
-            dot = val.dot(val)
-            return (dot <= radius), dot
+    p1 = track_a.positions[index_a].astype(np.float64)
+    p2 = track_b.positions[index_b].astype(np.float64)
+    direction = np.einsum('ij,ij->i', p1, p2) > 0
+    dot = np.square(p1 - p2).sum(axis=1)
+    return time_a[index_a], direction & (dot <= radius), dot
 
-        return check_sphere
 
-    def apply_direction(sfl, sfr):
-        def check_direction(x):
-            p1 = np.array([x[f'X{sfl}'], x[f'Y{sfl}'], x[f'Z{sfl}']])
-            p2 = np.array([x[f'X{sfr}'], x[f'Y{sfr}'], x[f'Z{sfr}']])
-            dot = p1.dot(p2)
-            return dot > 0
+def sub_track(track, time):
+    # new track holding only the given time points of track
+    index = np.searchsorted(track.time, time)
+    store = TrackStore.from_arrays(track.positions[index], track.time[index],
+                                   np.full(len(index), track.track_id))
+    return Track(track.track_id, track.name, track.color, track.suffix, store=store)
 
-        return check_direction
 
-    # get the points which are on same time point
-    same_time_points = track_a.get_values().merge(track_b.get_values(), on='time')
-
-    if same_time_points.index.size:
-        # if they are on same time point
-        # check if hey are in same direction
-        same_time_points['direction'] = same_time_points\
-            .apply(apply_direction(suffix_a, suffix_b), axis=1)
-
-        # get all the points in same direction
-        same_time_points = same_time_points[same_time_points['direction'] == True]
-        # if there are points in same direction
-        if same_time_points.index.size:
-            # check if they are in sphere
-            same_time_points['near'], same_time_points['distance'] = zip(*same_time_points.apply(
-                apply_sphere(_radius, suffix_a, suffix_b), axis=1))
-
-            same_time_points = same_time_points[same_time_points['near'] == True]
-
-            if same_time_points.index.size > 1:
-                # print(same_time_points)
-                sfl = suffix_a
-                sfr = suffix_b
-                tl_id = f'trackid{sfl}'
-                tr_id = f'trackid{sfr}'
-                left_track_id = same_time_points.iloc[0][tl_id]
-                right_track_id = same_time_points.iloc[0][tr_id]
-                top_pair = f'{left_track_id}{sfl}-{right_track_id}{sfr}'
-
-                same_time_points['top_pair'] = top_pair
-                same_time_points['suffix'] = f'{sfl},{sfr}'
-                same_time_points[sfl] = left_track_id
-                same_time_points[sfr] = right_track_id
-                track_a_rd = track_a.get_values().copy()
-                track_b_rd = track_b.get_values().copy()
-
-                _time = list(same_time_points['time'])
-                _track_a = Track(track_a.track_id, track_a.name, track_a.color, track_a.suffix,
-                                     raw_data=track_a_rd[track_a_rd['time'].isin(_time)])
-                _track_b = Track(track_b.track_id, track_b.name, track_b.color, track_b.suffix,
-                                     raw_data=track_b_rd[track_b_rd['time'].isin(_time)])
-
-                result = TrackPair(_track_a, _track_b, _time)
-                # result = result.append(same_time_points)
-
-                # further splitting of track if we want to see which time points are not together
-                # splited_same_points = split_df(same_time_points)
-                #
-                # # print(f'after split {len(splited_same_points)}')
-                # for index, pair in enumerate(splited_same_points):
-                #     _pair = pair.copy()
-                #     _pair['sub_pair'] = f'{top_pair}({index})'
-                #
-                #     result = result.append(_pair)
-    return result
+def compare_tracks(track_a, track_b, suffix_a, suffix_b, _radius):
+    # TrackPair of the time points where the tracks are together, None if there are fewer than 2
+    time, mask, _ = match_tracks(track_a, track_b, _radius)
+    if mask.sum() > 1:
+        _time = time[mask]
+        return TrackPair(sub_track(track_a, _time), sub_track(track_b, _time), _time.tolist())
+    return None
 
 
 def compare_all_tracks(tracks, suffixes, radius):
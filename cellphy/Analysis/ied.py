@@ -0,0 +1,175 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import norm, chi2
+from scipy.spatial.distance import cdist
+from .stats import RunningStats
+
+# upper bound on the number of distances held at once
+CHUNK_SIZE = 2 ** 20
+
+
+def pdist_chunks(positions, chunk_size=CHUNK_SIZE):
+    """
+    Pairwise distances of an (N, 3) array in scipy pdist (condensed) order,
+    yielded a few rows at a time so at most ~chunk_size values are alive.
+    Concatenating the chunks gives scipy.spatial.distance.pdist(positions).
+    """
+    r = np.asarray(positions, dtype=np.float64)
+    n = len(r)
+    row = 0
+    while row < n - 1:
+        width = n - row - 1
+        rows = max(1, min(chunk_size // width, n - 1 - row))
+        block = cdist(r[row:row + rows], r[row + 1:])
+        # keep j > i of every row, row-major is the condensed order
+        upper = np.arange(width)[None, :] >= np.arange(rows)[:, None]
+        yield block[upper]
+        row += rows
+
+
+def pdist(positions, chunk_size=CHUNK_SIZE):
+    chunks = list(pdist_chunks(positions, chunk_size))
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+
+def distance_stats(chunks, bins=None):
+    """
+    count / mean / stdev / min / max over an iterable of distance arrays, plus
+    a 'histogram' of the counts per bin when fixed bin edges are given.
+    """
+    stats = RunningStats(1)
+    _min, _max = np.inf, -np.inf
+    histogram = np.zeros(len(bins) - 1, dtype=np.int64) if bins is not None else None
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        stats.add(chunk[:, None])
+        _min = min(_min, chunk.min())
+        _max = max(_max, chunk.max())
+        if bins is not None:
+            histogram += np.histogram(chunk, bins=bins)[0]
+    count = int(stats.count[0])
+    result = {'count': count, 'mean': stats.get_mean()[0], 'stdev': stats.get_stdev()[0],
+              'min': _min if count else np.nan, 'max': _max if count else np.nan}
+    if bins is not None:
+        result['histogram'] = histogram
+    return result
+
+
+def pdist_stats(positions, chunk_size=CHUNK_SIZE, bins=None):
+    return distance_stats(pdist_chunks(positions, chunk_size), bins)
+
+
+def frame_distance_stats(frames, chunk_size=CHUNK_SIZE, bins=None):
+    """
+    Pairwise distance statistics of every frame, frames being (time, positions)
+    pairs such as FrameIndex.items(). Distances are reduced block by block and
+    never kept, so memory is bounded by chunk_size whatever the frame size.
+
+    Returns a dict of arrays, one entry per frame with at least two spots:
+    time, count, mean, stdev, min, max and, with bin edges, an
+    (n_frames, len(bins) - 1) histogram.
+    """
+    keys = ['time', 'count', 'mean', 'stdev', 'min', 'max']
+    columns = {key: [] for key in keys}
+    histograms = []
+    for time, positions in frames:
+        if len(positions) < 2:
+            continue
+        stats = pdist_stats(positions, chunk_size, bins)
+        stats['time'] = time
+        for key in keys:
+            columns[key].append(stats[key])
+        if bins is not None:
+            histograms.append(stats['histogram'])
+
+    result = {key: np.array(values) for key, values in columns.items()}
+    result['count'] = result['count'].astype(np.int64)
+    if bins is not None:
+        result['histogram'] = np.array(histograms, dtype=np.int64).reshape(-1, len(bins) - 1)
+    return result
+
+
+def sampled_pair_stats(positions, n_pairs, random_state, confidence=0.95):
+    """
+    Mean / stdev of the pairwise distances estimated from n_pairs random
+    pairs (drawn with replacement), with normal confidence bounds for the
+    mean and chi-square bounds for the stdev. Frames with at most n_pairs
+    pairs are computed exactly and their bounds collapse onto the values.
+    """
+    r = np.asarray(positions, dtype=np.float64)
+    n = len(r)
+    total = n * (n - 1) // 2
+    if total <= n_pairs:
+        stats = pdist_stats(r)
+        return {'pairs': total, 'sampled': total, 'mean': stats['mean'], 'stdev': stats['stdev'],
+                'mean_low': stats['mean'], 'mean_high': stats['mean'],
+                'stdev_low': stats['stdev'], 'stdev_high': stats['stdev']}
+
+    i = random_state.randint(0, n, n_pairs)
+    j = random_state.randint(0, n - 1, n_pairs)
+    # shift j past i so the pair is never a spot with itself
+    j += j >= i
+    d = np.sqrt(np.square(r[i] - r[j]).sum(axis=1))
+
+    mean = d.mean()
+    stdev = d.std(ddof=1)
+    alpha = 1. - confidence
+    z = norm.ppf(1. - alpha / 2.)
+    dof = n_pairs - 1
+    return {'pairs': total, 'sampled': n_pairs, 'mean': mean, 'stdev': stdev,
+            'mean_low': mean - z * stdev / np.sqrt(n_pairs), 'mean_high': mean + z * stdev / np.sqrt(n_pairs),
+            'stdev_low': stdev * np.sqrt(dof / chi2.ppf(1. - alpha / 2., dof)),
+            'stdev_high': stdev * np.sqrt(dof / chi2.ppf(alpha / 2., dof))}
+
+
+def frame_sampled_stats(frames, n_pairs=10000, seed=0, confidence=0.95):
+    """
+    sampled_pair_stats of every frame with at least two spots, as a dict of
+    arrays like frame_distance_stats. One RandomState seeded with seed is
+    used for all the frames in order, so a run is reproducible.
+    """
+    random_state = np.random.RandomState(seed)
+    keys = ['time', 'pairs', 'sampled', 'mean', 'stdev', 'mean_low', 'mean_high', 'stdev_low', 'stdev_high']
+    columns = {key: [] for key in keys}
+    for time, positions in frames:
+        if len(positions) < 2:
+            continue
+        stats = sampled_pair_stats(positions, n_pairs, random_state, confidence)
+        stats['time'] = time
+        for key in keys:
+            columns[key].append(stats[key])
+
+    result = {key: np.array(values) for key, values in columns.items()}
+    result['pairs'] = result['pairs'].astype(np.int64)
+    result['sampled'] = result['sampled'].astype(np.int64)
+    return result
+
+
+def nearest_neighbours(positions, k=1):
+    """
+    (N, k) distances from every spot to its k nearest other spots, NaN where
+    the frame has fewer than k + 1 spots. Uses a KD-tree, O(N log N).
+    """
+    r = np.asarray(positions, dtype=np.float64)
+    result = np.full((len(r), k), np.nan)
+    if len(r) < 2:
+        return result
+    # the first hit is the spot itself
+    d, _ = cKDTree(r).query(r, k=min(k + 1, len(r)))
+    d = d.reshape(len(r), -1)[:, 1:]
+    result[:, 0:d.shape[1]] = d
+    return result
+
+
+def frame_nearest_neighbours(frame_index, k=1):
+    """
+    k nearest neighbour distances of every spot of a FrameIndex, row i
+    belongs to frame_index.positions[i] so frame j is offsets[j]:offsets[j + 1]
+    and frame_index.owner tells the track of every row.
+    """
+    result = np.full((len(frame_index.positions), k), np.nan)
+    for index in range(len(frame_index)):
+        _slice = slice(frame_index.offsets[index], frame_index.offsets[index + 1])
+        result[_slice] = nearest_neighbours(frame_index.positions[_slice], k)
+    return result
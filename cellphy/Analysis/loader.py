@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import PurePath
+from .reader import read_tracks
+from .sidecar import load_store, save_store
+from .TrackStore import TrackStore
+from .Channel import Channel
+
+COLORS = [[0, 255, 255, 255], [255, 0, 255, 255], [255, 255, 0, 255]]
+
+
+def parse_store(file_path, suffix, header=1, chunk_size=None):
+    """
+    Worker side of load_channels: parse and index one file. When the sidecar
+    cache can be written only True is sent back and the parent maps the
+    arrays from disk, otherwise the store arrays themselves are returned.
+    """
+    store = load_store(file_path, suffix, header)
+    if store is not None:
+        return True
+    store = TrackStore.from_frame(read_tracks(file_path, suffix=suffix, header=header, chunk_size=chunk_size),
+                                  suffix)
+    if save_store(store, file_path, suffix, header):
+        return True
+    return store.positions, store.time, store.track_ids, store.offsets
+
+
+def load_channels(files, colors=None, header=1, chunk_size=None, processes=None, callback=None, on_error=None):
+    """
+    Channels of several files, file i getting suffix _C{i}, parsed and indexed
+    concurrently in worker processes. callback(done, total, file_path) is
+    called as every parsed file finishes. Without on_error the first failing
+    file raises; with it on_error(file_path, exception) is called instead and
+    only the channels that loaded are returned.
+    """
+    colors = colors if colors is not None else COLORS
+    suffixes = [f'_C{index}' for index in range(len(files))]
+    # files with an up to date sidecar cache are only memory mapped, no worker needed
+    stores = [load_store(file_path, suffix, header) for file_path, suffix in zip(files, suffixes)]
+    missing = [index for index, store in enumerate(stores) if store is None]
+    failed = set()
+
+    if len(missing) > 1 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes or len(missing)) as executor:
+            futures = {executor.submit(parse_store, files[index], suffixes[index], header, chunk_size): index
+                       for index in missing}
+            for done, future in enumerate(as_completed(futures)):
+                index = futures[future]
+                try:
+                    result = future.result()
+                    stores[index] = load_store(files[index], suffixes[index], header) if result is True \
+                        else TrackStore(*result)
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(files[index], e)
+                    failed.add(index)
+                if callback is not None:
+                    callback(len(files) - len(missing) + done + 1, len(files), files[index])
+
+    channels = []
+    done = len(files) - sum(store is None for store in stores) - len(failed)
+    for index, (file_path, suffix) in enumerate(zip(files, suffixes)):
+        if index in failed:
+            continue
+        channel = Channel(channel_name=PurePath(file_path).name, header=header, color=colors[index % len(colors)],
+                          suffix=suffix, chunk_size=chunk_size)
+        channel.data_file = file_path
+        parsed = stores[index] is None
+        try:
+            channel.load_data(file_path, store=stores[index])
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(file_path, e)
+            continue
+        finally:
+            if parsed and callback is not None:
+                done += 1
+                callback(done, len(files), file_path)
+        channels.append(channel)
+    return channels
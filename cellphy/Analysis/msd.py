@@ -0,0 +1,264 @@
+import numpy as np
+
+
+def _as_positions(positions):
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.ndim == 1:
+        positions = positions.reshape(-1, 1)
+    return positions
+
+
+def _fft_size(n):
+    # zero padding to >= 2n turns the circular correlation into a linear one
+    size = 1
+    while size < 2 * n:
+        size *= 2
+    return size
+
+
+def msd_fft(positions, limit=None):
+    """
+    Mean square displacement of a single track for every lag 1 .. N-1.
+
+    positions is an (N, D) array (a 1-D array is treated as D=1). With `limit`
+    only the first `limit` positions are used, same as Track.msd.
+    Uses MSD(m) = S1(m) - 2 * S2(m) where S2 is the positional
+    autocorrelation computed with an FFT, so the cost is O(N log N).
+    """
+    r = _as_positions(positions)
+    if limit:
+        r = r[0:limit]
+    n = r.shape[0]
+    if n < 2:
+        return np.zeros(0)
+    # MSD is translation invariant, centring keeps the FFT round-off small
+    r = r - r.mean(axis=0)
+
+    lag = np.arange(n)
+    pairs = n - lag
+
+    # S2: sum over k of r(k) . r(k + m)
+    f = np.fft.rfft(r, n=_fft_size(n), axis=0)
+    s2 = np.fft.irfft((f * f.conjugate()).real, axis=0)[0:n].sum(axis=1) / pairs
+
+    # S1: sum over k of |r(k)|^2 + |r(k + m)|^2, from prefix and suffix sums
+    d = np.square(r).sum(axis=1)
+    head = np.concatenate(([0.], np.cumsum(d)))[0:n]
+    tail = np.concatenate(([0.], np.cumsum(d[::-1])))[0:n]
+    s1 = (2. * d.sum() - head - tail) / pairs
+
+    return (s1 - 2. * s2)[1:]
+
+
+def pack_positions(positions, limit=None):
+    """
+    Pack a list of (N_i, 3) tracks into a zero padded (n_tracks, max_len, 3)
+    block. Returns the block and the number of valid rows of every track.
+    """
+    tracks = [_as_positions(p)[0:limit] if limit else _as_positions(p) for p in positions]
+    lengths = np.array([len(p) for p in tracks], dtype=np.int64)
+    width = tracks[0].shape[1] if len(tracks) else 3
+    block = np.zeros((len(tracks), lengths.max() if len(tracks) else 0, width))
+    for row, p in enumerate(tracks):
+        block[row, 0:len(p)] = p
+    return block, lengths
+
+
+def _msd_block(block, lengths):
+    # batched version of msd_fft, rows past lengths[i] must be zero
+    n_tracks, size, _ = block.shape
+    lag = np.arange(size)
+    pairs = lengths[:, None] - lag[None, :]
+    valid = pairs > 0
+    safe_pairs = np.where(valid, pairs, 1)
+
+    mask = (lag[None, :] < lengths[:, None])[:, :, None]
+    mean = block.sum(axis=1) / np.maximum(lengths, 1)[:, None]
+    block = (block - mean[:, None, :]) * mask
+
+    f = np.fft.rfft(block, n=_fft_size(size), axis=1)
+    s2 = np.fft.irfft((f * f.conjugate()).real, axis=1)[:, 0:size].sum(axis=2) / safe_pairs
+
+    d = np.square(block).sum(axis=2)
+    csum = np.concatenate((np.zeros((n_tracks, 1)), np.cumsum(d, axis=1)), axis=1)
+    rows = np.arange(n_tracks)[:, None]
+    total = csum[np.arange(n_tracks), lengths][:, None]
+    head = csum[:, 0:size]
+    tail = total - csum[rows, np.clip(lengths[:, None] - lag[None, :], 0, size)]
+    s1 = (2. * total - head - tail) / safe_pairs
+
+    result = np.where(valid, s1 - 2. * s2, np.nan)
+    return result[:, 1:], np.maximum(pairs, 0)[:, 1:]
+
+
+def msd_matrix(positions, limit=None, chunk_elements=2 ** 22):
+    """
+    MSD of many tracks at once.
+
+    positions is a list of (N_i, 3) arrays. Returns an (n_tracks, max_len - 1)
+    matrix where column j holds lag j + 1, and the matching number of
+    displacement pairs that went into every value. Row i equals
+    msd_fft(positions[i], limit) followed by NaN padding.
+
+    Tracks are sorted by length and packed `chunk_elements` floats at a time,
+    which keeps both the padding waste and the FFT working set bounded.
+    """
+    lengths = np.array([min(len(p), limit) if limit else len(p) for p in positions], dtype=np.int64)
+    width = max(lengths.max() - 1, 0) if len(lengths) else 0
+    result = np.full((len(lengths), width), np.nan)
+    counts = np.zeros((len(lengths), width), dtype=np.int64)
+
+    order = np.argsort(lengths, kind='mergesort')
+    start = 0
+    while start < len(order):
+        stop = start + 1
+        # lengths are ascending, so the last track of the chunk sets its width
+        while stop < len(order) and (stop - start + 1) * _fft_size(lengths[order[stop]]) * 3 <= chunk_elements:
+            stop += 1
+        rows = order[start:stop]
+        block, block_lengths = pack_positions([positions[i] for i in rows], limit)
+        chunk, chunk_counts = _msd_block(block, block_lengths)
+        result[rows, 0:chunk.shape[1]] = chunk
+        counts[rows, 0:chunk.shape[1]] = chunk_counts
+        start = stop
+    return result, counts
+
+
+def msd_time_lag(positions, time, max_lag=None):
+    """
+    Gap aware MSD of one track, pairs are binned by their real time difference.
+
+    time must be sorted, unique and integral (frame numbers). Returns
+    (lags, msd, counts) for lags 1 .. max_lag frames (default: the time span
+    of the track); msd is NaN for lags without any pair.
+
+    Mostly dense tracks go through a masked FFT over the observed time span,
+    sparse ones walk the sorted time array one index offset at a time, so
+    memory stays proportional to the number of observed points either way.
+    """
+    r = _as_positions(positions)
+    time = np.asarray(time).astype(np.int64)
+    n = len(time)
+    span = int(time[-1] - time[0]) if n else 0
+    if max_lag is None:
+        max_lag = span
+    lags = np.arange(1, max_lag + 1)
+    if n < 2 or max_lag < 1:
+        return lags, np.full(max_lag, np.nan), np.zeros(max_lag, dtype=np.int64)
+
+    r = r - r.mean(axis=0)
+    size = min(span, max_lag) + 1
+    if span + 1 <= 4 * n:
+        sums, counts = _time_lag_fft(r, time - time[0], span + 1)
+        sums, counts = sums[0:size], counts[0:size]
+    else:
+        sums, counts = _time_lag_pairs(r, time, size - 1)
+
+    result = np.full(max_lag, np.nan)
+    pair_counts = np.zeros(max_lag, dtype=np.int64)
+    observed = counts[1:] > 0
+    result[0:size - 1][observed] = sums[1:][observed] / counts[1:][observed]
+    pair_counts[0:size - 1] = counts[1:]
+    return lags, result, pair_counts
+
+
+def _time_lag_fft(r, frame, span):
+    # sum over observed pairs of |r_i - r_j|^2 = |r_i|^2 + |r_j|^2 - 2 r_i . r_j,
+    # every term is a (cross) correlation of masked series over the time span
+    dense = np.zeros((span, r.shape[1]))
+    dense[frame] = r
+    mask = np.zeros(span)
+    mask[frame] = 1.
+    square = np.zeros(span)
+    square[frame] = np.square(r).sum(axis=1)
+
+    size = _fft_size(span)
+    f_r = np.fft.rfft(dense, n=size, axis=0)
+    f_m = np.fft.rfft(mask, n=size)
+    f_s = np.fft.rfft(square, n=size)
+
+    def correlate(a, b):
+        return np.fft.irfft(a.conjugate() * b, n=size)[0:span]
+
+    s2 = np.fft.irfft((f_r * f_r.conjugate()).real, n=size, axis=0)[0:span].sum(axis=1)
+    s1 = correlate(f_s, f_m) + correlate(f_m, f_s)
+    counts = np.rint(correlate(f_m, f_m)).astype(np.int64)
+    return s1 - 2. * s2, counts
+
+
+def _time_lag_pairs(r, time, max_lag):
+    sums = np.zeros(max_lag + 1)
+    counts = np.zeros(max_lag + 1, dtype=np.int64)
+    for k in range(1, len(time)):
+        dt = time[k:] - time[:-k]
+        # time is increasing, so dt only grows with the offset k
+        if dt.min() > max_lag:
+            break
+        keep = dt <= max_lag
+        d2 = np.square(r[k:][keep] - r[:-k][keep]).sum(axis=1)
+        sums += np.bincount(dt[keep], weights=d2, minlength=max_lag + 1)
+        counts += np.bincount(dt[keep], minlength=max_lag + 1)
+    return sums, counts
+
+
+def time_lag_msd_matrix(positions, times, limit=None):
+    """
+    msd_time_lag for many tracks, laid out like msd_matrix. With `limit` every
+    track is cut to its first `limit` frames and lags go up to limit - 1.
+    """
+    spans = [int(t[-1] - t[0]) if len(t) else 0 for t in times]
+    width = limit - 1 if limit else max(spans + [0])
+    result = np.full((len(times), width), np.nan)
+    counts = np.zeros((len(times), width), dtype=np.int64)
+    for row, (p, t) in enumerate(zip(positions, times)):
+        if limit:
+            window = (t - t[0]) < limit
+            p, t = p[window], t[window]
+        _, result[row], counts[row] = msd_time_lag(p, t, max_lag=width)
+    return result, counts
+
+
+def log_lags(max_lag, n_lags=20):
+    # integer lags 1 .. max_lag, evenly spaced in log, duplicates dropped
+    if max_lag < 1:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.round(np.logspace(0, np.log10(max_lag), n_lags)).astype(np.int64))
+
+
+def msd_at_lags(positions, lags, offsets=None):
+    """
+    MSD evaluated only at the given lags, O(N) per lag.
+
+    Without offsets positions is one (N, 3) track and an array of len(lags)
+    is returned (NaN for lags >= N). With offsets, positions holds many tracks
+    back to back (track i is offsets[i]:offsets[i + 1]) and the result is an
+    (n_tracks, len(lags)) matrix together with the per lag pair counts.
+    """
+    r = _as_positions(positions)
+    lags = np.asarray(lags, dtype=np.int64)
+    single = offsets is None
+    if single:
+        offsets = np.array([0, len(r)])
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_tracks = len(offsets) - 1
+    lengths = np.diff(offsets)
+    owner = np.repeat(np.arange(n_tracks), lengths)
+    end = offsets[1:][owner]
+
+    result = np.full((n_tracks, len(lags)), np.nan)
+    counts = np.zeros((n_tracks, len(lags)), dtype=np.int64)
+    for column, lag in enumerate(lags):
+        if lag < 1 or lag >= len(r):
+            continue
+        # a pair is valid when both ends belong to the same track
+        valid = np.arange(lag, len(r)) < end[:-lag]
+        d2 = np.square(r[lag:] - r[:-lag]).sum(axis=1)
+        count = np.bincount(owner[:-lag][valid], minlength=n_tracks)
+        total = np.bincount(owner[:-lag][valid], weights=d2[valid], minlength=n_tracks)
+        observed = count > 0
+        result[observed, column] = total[observed] / count[observed]
+        counts[:, column] = count
+
+    if single:
+        return result[0]
+    return result, counts
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+
+
+def column_names(suffix):
+    # column layout of an Imaris spot export
+    return [f'X{suffix}', f'Y{suffix}', f'Z{suffix}', 'unit', 'category', 'collection', 'time',
+            f'trackid{suffix}', 'id']
+
+
+def column_types(suffix):
+    # only these columns are parsed, positions as float32, time and track id as int32
+    return {f'X{suffix}': np.float32, f'Y{suffix}': np.float32, f'Z{suffix}': np.float32,
+            'time': np.int32, f'trackid{suffix}': np.int32}
+
+
+def data_start(file_path, header=1):
+    """
+    Number of raw lines before the first data row, header being the pandas
+    row index (blank lines not counted) of the column header line.
+    """
+    skip = 0
+    seen = 0
+    with open(file_path, 'r') as fd:
+        for line in fd:
+            skip += 1
+            if line.strip():
+                seen += 1
+                if seen > header:
+                    break
+    return skip
+
+
+def read_tracks(file_path, suffix='_C0', header=1, chunk_size=None):
+    """
+    X{suffix}, Y{suffix}, Z{suffix}, time, trackid{suffix} columns of an export.
+
+    The whole file is parsed by pyarrow when it is installed, otherwise by the
+    pandas C parser. With chunk_size the file is read chunk_size rows at a time
+    so only the compact typed columns of the file are ever held in memory.
+    """
+    names = column_names(suffix)
+    types = column_types(suffix)
+    skip = data_start(file_path, header)
+
+    if chunk_size is None and pyarrow is not None:
+        table = pyarrow_csv.read_csv(
+            str(file_path),
+            read_options=pyarrow_csv.ReadOptions(skip_rows=skip, column_names=names),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=list(types), column_types={k: pyarrow.from_numpy_dtype(v) for k, v in types.items()}))
+        return table.to_pandas()
+
+    reader = pd.read_csv(file_path, names=names, header=None, skiprows=skip, usecols=list(types), dtype=types,
+                         chunksize=chunk_size)
+    if chunk_size is None:
+        return reader[list(types)]
+    return pd.concat([chunk[list(types)] for chunk in reader], ignore_index=True)
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import numpy as np
+from .TrackStore import TrackStore
+
+# bump whenever the layout or the parsing of the stored arrays changes
+VERSION = 1
+ARRAYS = ['positions', 'time', 'track_ids', 'offsets']
+
+
+def cache_dir(file_path, suffix):
+    # sidecar directory next to the csv: data.csv -> .data.csv_C0.cellphy
+    file_path = os.path.abspath(file_path)
+    return os.path.join(os.path.dirname(file_path), f'.{os.path.basename(file_path)}{suffix}.cellphy')
+
+
+def fingerprint(file_path, suffix, header):
+    stat = os.stat(file_path)
+    return {'version': VERSION, 'path': os.path.abspath(file_path), 'size': stat.st_size,
+            'mtime': stat.st_mtime_ns, 'suffix': suffix, 'header': header}
+
+
+def load_store(file_path, suffix, header):
+    """
+    TrackStore of file_path from its sidecar cache, arrays memory mapped
+    read only. None when there is no cache or it was written for another
+    version of the file or other parse parameters.
+    """
+    directory = cache_dir(file_path, suffix)
+    try:
+        with open(os.path.join(directory, 'key.json'), 'r') as fd:
+            key = json.load(fd)
+        if key != fingerprint(file_path, suffix, header):
+            return None
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ARRAYS]
+    except (OSError, ValueError):
+        return None
+    return TrackStore(*arrays)
+
+
+def save_store(store, file_path, suffix, header):
+    """
+    Write the store arrays next to file_path. The key is written last so a
+    partly written cache is never picked up; failures (read only folder,
+    full disk) only mean the file is parsed again next time.
+    """
+    directory = cache_dir(file_path, suffix)
+    try:
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(store, name)))
+        with open(os.path.join(directory, 'key.json'), 'w') as fd:
+            json.dump(fingerprint(file_path, suffix, header), fd)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    Count, mean and sum of squared deviations for `size` independent columns,
+    updated a batch of rows at a time (Chan et al. parallel form of Welford's
+    algorithm). NaN values are ignored, memory does not grow with the data.
+    """
+
+    def __init__(self, size=1):
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def add(self, values):
+        # values: (n_samples, size) or (size,) for a single sample
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        observed = np.isfinite(values)
+        count = observed.sum(axis=0)
+        safe_count = np.maximum(count, 1)
+        mean = np.where(observed, values, 0.).sum(axis=0) / safe_count
+        m2 = np.where(observed, np.square(values - mean), 0.).sum(axis=0)
+        self.merge(count, mean, m2)
+
+    def merge(self, count, mean, m2):
+        total = self.count + count
+        safe_total = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + np.square(delta) * self.count * count / safe_total
+        self.count = total
+
+    def get_mean(self):
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    def get_variance(self):
+        # sample variance
+        return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), np.nan)
+
+    def get_stdev(self):
+        return np.sqrt(self.get_variance())
+
+    def get_sem(self):
+        return self.get_stdev() / np.sqrt(np.maximum(self.count, 1))
@@ -7,9 +7,13 @@ import PyQt5.QtCore as QtCore
 from pathlib import PurePath
 from .ChannelWidget import ChannelWidget
 from .CoTrafficWidget import CoTrafficWidget
+from .SweepWidget import SweepWidget
 import time
 import itertools
-from cellphy.Analysis.functions import compare_tracks
+import numpy as np
+from cellphy.Analysis.loader import load_channels
+from cellphy.Analysis.colocalize import colocalized_pairs, compare_track_lists
+from cellphy.Analysis.RadiusSweep import RadiusSweep
 
 
 class AnalyzerWrapper(QMainWindow):
@@ -36,16 +40,35 @@ class AnalyzerWrapper(QMainWindow):
         self.tab_widget.setTabPosition(QTabWidget.East)
 
         self.files = files
-        self.title = ''
+        self.title = ' - '.join(PurePath(file).name for file in self.files)
         self.channels = []
         self.threads = []
-        colors = [[0, 255, 255, 255], [255, 0, 255, 255], [255, 255, 0, 255]]
+        # (pairs, radius) of the sweep radii waiting for their group comparison, run one at a time
+        self.group_queue = []
+        self.group_running = False
+        self.setCentralWidget(self.tab_widget)
 
-        for index, file in enumerate(self.files):
-            self.parent.print(f'> adding channel {PurePath(file).name}\n')
-            self.title += f'{" - " if index > 0 else "" }{PurePath(file).name}'
-            channel = Channel(file, color=colors[index], suffix=f'_C{index}')
-            self.channels.append(channel)
+        # parse the files in worker processes, widgets are added once they are back
+        self.parent.print(f'> adding channels {self.title}\n')
+        loader_thread = ChannelLoaderThread(self.files)
+        loader_thread.progress.connect(self.__loading_progress)
+        loader_thread.result_ready.connect(self.add_channels)
+        loader_thread.error.connect(self.__loading_error)
+        loader_thread.finished.connect(loader_thread.deleteLater)
+        loader_thread.start()
+        self.threads.append(loader_thread)
+
+    def __loading_progress(self, done, total, file):
+        self.parent.print(f'> done adding channel {PurePath(file).name}\n')
+        self.parent.status_bar.showMessage(f'> loaded {done}/{total} channels')
+
+    def __loading_error(self, message):
+        self.parent.print(message)
+        self.parent.status_bar.showMessage(message.strip())
+
+    def add_channels(self, channels):
+        self.channels = channels
+        for channel in self.channels:
             channel_widget = ChannelWidget(channel, self)
             channel_widget.track_clicked.connect(self.__track_clicked)
             channel_widget.show_bin_total.connect(self.display_bin_total)
@@ -55,15 +78,14 @@ class AnalyzerWrapper(QMainWindow):
             # channel_widget.display_ied_channel.connect(self.display_channel_ied)
 
             self.tab_widget.addTab(channel_widget, f'{channel.name}-{channel.suffix}')
-            self.parent.print(f'> done adding channel {PurePath(file).name}\n')
 
         if len(self.channels) > 1:
             self.tool_bar = AnalysisToolWidget()
             self.tool_bar.radius_change.connect(self.compare_tracks)
+            self.tool_bar.radius_sweep.connect(self.sweep_radii)
             self.tool_bar.set_radius(1.0)
             self.tool_bar.display_all_channels.connect(self.__render_all_channels)
             self.addToolBar(self.tool_bar)
-        self.setCentralWidget(self.tab_widget)
         self.tab_widget.setCurrentIndex(0)
 
     def __track_clicked(self, track):
@@ -92,18 +114,57 @@ class AnalyzerWrapper(QMainWindow):
         thread_pair.start()
         self.threads.append(thread_pair)
 
-    def process_pairs(self, pairs, radius):
+    def sweep_radii(self, radii):
+        thread_sweep = SweepThread(self.channels, radii)
+        thread_sweep.result_ready.connect(self.__sweep_pairs)
+        thread_sweep.sweep_ready.connect(self.show_sweep)
+        thread_sweep.output.connect(self.parent.print)
+        thread_sweep.status.connect(self.parent.status_bar.showMessage)
+        thread_sweep.finished.connect(self.parent.status_bar.currentMessage)
+        thread_sweep.finished.connect(thread_sweep.deleteLater)
+
+        thread_sweep.start()
+        self.threads.append(thread_sweep)
+
+    def show_sweep(self, sweeps, radii):
+        sweep_widget = SweepWidget(sweeps, radii, f'Sweep {min(radii):g}-{max(radii):g}')
+        self.tab_widget.insertTab(0, sweep_widget, sweep_widget.title)
+        self.tab_widget.setCurrentIndex(0)
+        self.tool_bar.enable_analyze_btn()
+
+    def __sweep_pairs(self, pairs, radius):
+        # one radius of a running sweep: tabs now, the group comparison queued after the previous ones
+        self.show_pairs(pairs, radius)
         if len(pairs) > 1:
-            group_thread = CompareFinalGroupThread(pairs, self.channels, radius)
-            group_thread.result_ready.connect(self.show_group)
-            group_thread.output.connect(self.parent.print)
-            group_thread.status.connect(self.parent.status_bar.showMessage)
-            group_thread.finished.connect(self.parent.status_bar.currentMessage)
-            group_thread.finished.connect(group_thread.deleteLater)
+            self.group_queue.append((pairs, radius))
+            if not self.group_running:
+                self.__next_group()
+
+    def __next_group(self):
+        self.group_running = bool(self.group_queue)
+        if self.group_running:
+            group_thread = self.start_group(*self.group_queue.pop(0))
+            group_thread.finished.connect(self.__next_group)
+
+    def start_group(self, pairs, radius):
+        group_thread = CompareFinalGroupThread(pairs, self.channels, radius)
+        group_thread.result_ready.connect(self.show_group)
+        group_thread.output.connect(self.parent.print)
+        group_thread.status.connect(self.parent.status_bar.showMessage)
+        group_thread.finished.connect(self.parent.status_bar.currentMessage)
+        group_thread.finished.connect(group_thread.deleteLater)
+
+        group_thread.start()
+        self.threads.append(group_thread)
+        return group_thread
 
-            group_thread.start()
-            self.threads.append(group_thread)
+    def process_pairs(self, pairs, radius):
+        if len(pairs) > 1:
+            self.start_group(pairs, radius)
+        self.show_pairs(pairs, radius)
+        self.tool_bar.enable_analyze_btn()
 
+    def show_pairs(self, pairs, radius):
         for tpair in pairs:
             channel_a = tpair['c_a']
             channel_b = tpair['c_b']
@@ -122,7 +183,6 @@ class AnalyzerWrapper(QMainWindow):
             self.tab_widget.insertTab(0, cotraffic_widget, cotraffic_widget.title)
 
         self.tab_widget.setCurrentIndex(0)
-        self.tool_bar.enable_analyze_btn()
 
     def show_group(self, group, radius):
         group_cotraffic_widget_title = f'Group {radius:.1f}'
@@ -159,29 +219,53 @@ class AnalyzerWrapper(QMainWindow):
     #     union.to_csv('./union_radius.csv')
 
 
+class ChannelLoaderThread(QThread):
+    result_ready = QtCore.pyqtSignal(list)
+    # done, total, file
+    progress = QtCore.pyqtSignal(int, int, str)
+    error = QtCore.pyqtSignal(str)
+
+    def __init__(self, files, parent=None):
+        QThread.__init__(self, parent)
+        self.files = files
+
+    def run(self):
+        # files that fail are reported on error, the channels that did load are still sent
+        channels = []
+        try:
+            channels = load_channels(self.files,
+                                     callback=lambda done, total, file: self.progress.emit(done, total, file),
+                                     on_error=lambda file, e: self.error.emit(
+                                         f'> failed loading {PurePath(file).name}: {e}\n'))
+        except Exception as e:
+            self.error.emit(f'> failed loading channels: {e}\n')
+        self.result_ready.emit(channels)
+
+
 class CompareThread(QThread):
     result_ready = QtCore.pyqtSignal(list, float)
     status = QtCore.pyqtSignal(str)
     output = QtCore.pyqtSignal(str)
 
-    def __init__(self, channels, radius, parent=None):
+    def __init__(self, channels, radius, processes=None, parent=None):
         QThread.__init__(self, parent)
         self.channels = channels
         self.radius = radius
+        # worker processes for the chunks of channel a tracks, None: all cores
+        self.processes = processes
 
     def run(self):
         results = []
         start_time = time.time()
         self.output.emit(f'> started processing for Compare thread {self.radius}\n')
         for channel_a, channel_b in itertools.combinations(self.channels, 2):
-            rendered_df = []
             self.output.emit(f'  > processing channels {channel_a.name} & {channel_b.name}\n')
-            for track_a in channel_a.tracks:
-                for track_b in channel_b.tracks:
-                    self.status.emit(f'> comparing track {track_a.track_id} - {track_b.track_id}')
-                    pair = compare_tracks(track_a, track_b, channel_a.suffix, channel_b.suffix, self.radius)
-                    if pair is not None:
-                        rendered_df.append(pair)
+            # one pass over the frames instead of compare_tracks for every track combination,
+            # the tracks of channel a split in chunks over the worker processes
+            rendered_df = colocalized_pairs(channel_a.tracks, channel_b.tracks, self.radius,
+                                            callback=lambda done, total: self.status.emit(
+                                                f'> comparing {done}/{total}'), processes=self.processes)
+            self.output.emit(f'    > {len(rendered_df)} pairs\n')
 
             if len(rendered_df) > 0:
                 results.append({'pairs': rendered_df.copy(), 'c_a': channel_a, 'c_b': channel_b})
@@ -189,6 +273,42 @@ class CompareThread(QThread):
         self.result_ready.emit(results, self.radius)
 
 
+class SweepThread(QThread):
+    # pairs of one radius, like CompareThread, then all the sweeps with their radii
+    result_ready = QtCore.pyqtSignal(list, float)
+    sweep_ready = QtCore.pyqtSignal(list, list)
+    status = QtCore.pyqtSignal(str)
+    output = QtCore.pyqtSignal(str)
+
+    def __init__(self, channels, radii, processes=None, parent=None):
+        QThread.__init__(self, parent)
+        self.channels = channels
+        self.radii = radii
+        self.processes = processes
+
+    def run(self):
+        start_time = time.time()
+        self.output.emit(f'> started radius sweep {min(self.radii):g} - {max(self.radii):g}\n')
+        # the matching spots are found once for the largest radius
+        sweeps = []
+        for channel_a, channel_b in itertools.combinations(self.channels, 2):
+            self.output.emit(f'  > processing channels {channel_a.name} & {channel_b.name}\n')
+            sweep = RadiusSweep(channel_a.tracks, channel_b.tracks, max(self.radii),
+                                callback=lambda done, total: self.status.emit(f'> comparing {done}/{total}'),
+                                processes=self.processes)
+            sweeps.append((channel_a, channel_b, sweep))
+
+        for radius in self.radii:
+            results = []
+            for channel_a, channel_b, sweep in sweeps:
+                pairs = sweep.pairs(radius)
+                if len(pairs) > 0:
+                    results.append({'pairs': pairs, 'c_a': channel_a, 'c_b': channel_b})
+            self.result_ready.emit(results, radius)
+        self.output.emit(f'> done radius sweep in {time.time() - start_time}\n')
+        self.sweep_ready.emit(sweeps, list(self.radii))
+
+
 class CompareFinalGroupThread(QThread):
     result_ready = QtCore.pyqtSignal(list, float)
     status = QtCore.pyqtSignal(str)
@@ -221,13 +341,11 @@ class CompareFinalGroupThread(QThread):
         for p in first_pairs:
             c_a_filtered_tracks.append(p.tracks[c_a.suffix])
 
-        groups = []
-        for m_track in c_a_filtered_tracks:
-            for track in other_channels[0].tracks:
-                result = compare_tracks(m_track, track, m_track.suffix, track.suffix, self.radius)
-                if result:
-                    groups.append(result)
-                self.status.emit(f'> comparing group tracks m: {m_track.track_id}- O:{track.track_id}')
+        # only pairs overlapping in time and space reach compare_tracks
+        groups = compare_track_lists(c_a_filtered_tracks, other_channels[0].tracks, self.radius,
+                                     bounds_b=other_channels[0].track_bounds(),
+                                     callback=lambda done, total: self.status.emit(
+                                         f'> comparing group tracks {done}/{total}'))
         self.output.emit(f'> done processing group for radius : {self.radius} in {time.time() - start_time}\n')
         self.result_ready.emit(groups, self.radius)
 
@@ -235,6 +353,7 @@ class CompareFinalGroupThread(QThread):
 class AnalysisToolWidget(QToolBar):
 
     radius_change = QtCore.pyqtSignal(float)
+    radius_sweep = QtCore.pyqtSignal(list)
     display_all_channels = QtCore.pyqtSignal()
 
     def __init__(self, parent=None):
@@ -256,11 +375,32 @@ class AnalysisToolWidget(QToolBar):
         self.radius_layout.addWidget(self.analyse_btn)
         self.radius_tool_frame.setLayout(self.radius_layout)
 
+        # radius sweep: start, stop, step
+        self.sweep_tool_frame = QFrame()
+        self.sweep_tool_frame.setFrameShadow(QFrame.Plain)
+        self.sweep_tool_frame.setFrameShape(QFrame.StyledPanel)
+        self.sweep_layout = QHBoxLayout(self.sweep_tool_frame)
+        self.sweep_boxes = []
+        for prefix, value in [('From ', 0.2), ('To ', 2.0), ('Step ', 0.1)]:
+            box = QDoubleSpinBox()
+            box.setPrefix(prefix)
+            box.setMinimum(0)
+            box.setSingleStep(0.1)
+            box.setValue(value)
+            self.sweep_layout.addWidget(box)
+            self.sweep_boxes.append(box)
+        self.sweep_btn = QPushButton('Sweep CC')
+        self.sweep_btn.clicked.connect(self.sweep_btn_clicked)
+        self.sweep_layout.addWidget(self.sweep_btn)
+        self.sweep_tool_frame.setLayout(self.sweep_layout)
+
         self.display_all_btn = QPushButton('Show all Channels')
         self.display_all_btn.clicked.connect(self.display_all_btn_clicked)
 
         self.addWidget(self.radius_tool_frame)
         self.addSeparator()
+        self.addWidget(self.sweep_tool_frame)
+        self.addSeparator()
         self.addWidget(self.display_all_btn)
 
     def set_radius(self, value):
@@ -274,9 +414,18 @@ class AnalysisToolWidget(QToolBar):
         self.spin_box.setEnabled(False)
         self.radius_change.emit(self.spin_box.value())
 
+    def sweep_btn_clicked(self):
+        start, stop, step = [box.value() for box in self.sweep_boxes]
+        if step <= 0 or stop < start:
+            return
+        self.analyse_btn.setEnabled(False)
+        self.sweep_btn.setEnabled(False)
+        self.radius_sweep.emit(np.round(np.arange(start, stop + step / 2., step), 6).tolist())
+
     def enable_analyze_btn(self):
         self.spin_box.setEnabled(True)
         self.analyse_btn.setEnabled(True)
+        self.sweep_btn.setEnabled(True)
 
     def display_all_btn_clicked(self):
         self.display_all_channels.emit()
@@ -1,5 +1,6 @@
 from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QPushButton, QToolBar, QMainWindow, QFileDialog
 import PyQt5.QtCore as QtCore
+import numpy as np
 from cellphy.Analysis.Track import Track
 from cellphy.Analysis.Channel import Channel
 
@@ -13,6 +14,7 @@ class ChannelWidget(QMainWindow):
     def __init__(self, channel, parent=None):
         QMainWindow.__init__(self, parent)
         self.listWidget = None
+        self.shown = None
         self.channel = channel
         self.bin_value = 0
         self.tool_bar = ToolBarWidget(self)
@@ -25,13 +27,15 @@ class ChannelWidget(QMainWindow):
         self.apply_filter()
 
     def populate_items(self):
+        # one item per track of the channel, the filter only hides / shows them
         self.listWidget = None
         self.listWidget = QListWidget()
-        for index, track in enumerate(self.channel.tracks):
+        for index, (track_id, length) in enumerate(zip(self.channel.backup_ids, self.channel.track_lengths)):
             list_item = QListWidgetItem()
-            list_item.setText(f'{index} : {track.track_id} - ({len(track.time_position_map)})')
-            list_item.setData(QtCore.Qt.UserRole+1, f'{track.track_id}')
+            list_item.setText(f'{index} : {track_id} - ({length})')
+            list_item.setData(QtCore.Qt.UserRole+1, f'{track_id}')
             self.listWidget.addItem(list_item)
+        self.shown = np.ones(self.listWidget.count(), dtype=bool)
 
         self.listWidget.itemClicked.connect(self.__track_clicked)
         self.setCentralWidget(self.listWidget)
@@ -51,29 +55,29 @@ class ChannelWidget(QMainWindow):
 
     def __export_distance(self):
         headers = ['TrackId', 'Distance']
-        _csv = ''
-        # get headers 1st
-        _csv += ','.join(headers) + '\n'
-
-        # now get the data
-        for track in self.channel.tracks:
-            # track.ied_distance()
-            for distance in track.ied_distance():
-                row_vals = list()
-                row_vals.append(str(track.track_id))
-                row_vals.append(str(distance))
-                _csv += ','.join(row_vals) + '\n'
 
         file, _ = QFileDialog.getSaveFileName(self, "Select file name Distance .csv files",
                                               QtCore.QDir.homePath(), "CSV (*.csv)")
+        if not file:
+            return
 
-        fd = open(file, 'w')
-        fd.write(_csv)
-        fd.close()
+        with open(file, 'w') as fd:
+            # get headers 1st
+            fd.write(','.join(headers) + '\n')
+
+            # now stream the data, one block of distances at a time
+            for track in self.channel.tracks:
+                for distances in track.ied_chunks():
+                    np.savetxt(fd, distances, fmt=f'{track.track_id},%s')
 
     def apply_filter(self, value=4):
         self.channel.apply_filter(filter_value = value)
-        self.populate_items()
+        if self.listWidget is None or self.listWidget.count() != len(self.channel.mask):
+            self.populate_items()
+        # only the items whose state changed are touched
+        for row in np.flatnonzero(self.shown != self.channel.mask):
+            self.listWidget.item(row).setHidden(not self.channel.mask[row])
+        self.shown = self.channel.mask.copy()
 
     def bin_updated(self, value=0):
         self.bin_value = value
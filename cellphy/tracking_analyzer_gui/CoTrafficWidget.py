@@ -1,5 +1,6 @@
 from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QMainWindow, QAction, QSpinBox
 import PyQt5.QtCore as QtCore
+import numpy as np
 from cellphy.Analysis import Track, TrackPair, Channel
 
 
@@ -64,23 +65,31 @@ class CoTrafficWidget(QMainWindow):
         cb_action.triggered.connect(self.__show_cb)
         self.tool_bar.addAction(cb_action)
 
+        self.pair_lengths = np.array([len(pair.time) for pair in self.data], dtype=np.int64)
+        self.shown = np.ones(len(self.data), dtype=bool)
+        self.populate_items()
         self.apply_filter()
 
-    def apply_filter(self, filter_value=4):
-        self.min_time_points = filter_value
+    def populate_items(self):
+        # one item per pair, the filter only hides / shows them
         self.list_widget = QListWidget()
-        self.pairs = dict()
-        for pair in self.data:
-            if len(pair.time) >= self.min_time_points:
-                list_item = QListWidgetItem()
-                list_item.setText(f'{pair.name} - ({len(pair.time)})')
-                list_item.setData(QtCore.Qt.UserRole + 1, pair.name)
-                self.list_widget.addItem(list_item)
-                self.pairs[pair.name] = pair
+        for pair, length in zip(self.data, self.pair_lengths):
+            list_item = QListWidgetItem()
+            list_item.setText(f'{pair.name} - ({length})')
+            list_item.setData(QtCore.Qt.UserRole + 1, pair.name)
+            self.list_widget.addItem(list_item)
 
         self.list_widget.itemClicked.connect(self.__track_clicked)
         self.setCentralWidget(self.list_widget)
 
+    def apply_filter(self, filter_value=4):
+        self.min_time_points = filter_value
+        mask = self.pair_lengths >= self.min_time_points
+        for row in np.flatnonzero(self.shown != mask):
+            self.list_widget.item(row).setHidden(not mask[row])
+        self.shown = mask
+        self.pairs = {pair.name: pair for pair, keep in zip(self.data, mask) if keep}
+
     def __show_ca(self):
         self.__extract_channels()
         self.show_channel.emit(self.channel_a, True, True, True)
@@ -1,7 +1,9 @@
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QFileDialog,QAction, QMainWindow
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QFileDialog,QAction, QMainWindow, QSpinBox
 import PyQt5.QtCore as QtCore
 from cellphy.Analysis.Track import Track
 from cellphy.Analysis.Channel import Channel
+from cellphy.Analysis.ied import pdist_chunks
+import numpy as np
 import pandas as pd
 
 
@@ -21,23 +23,41 @@ class IEDWidget(QMainWindow):
         self.create_csv_act = QAction('Export IED')
         self.create_csv_act.triggered.connect(self.export_csv)
         self.tool_bar.addAction(self.create_csv_act)
-        self.ied_headers = ['Time', 'Mean', 'Standard Deviation']
+        self.ied_headers = []
 
         self.create_dist_csv_act = QAction('Export Distance')
         self.create_dist_csv_act.triggered.connect(self.export_dist_csv)
         self.tool_bar.addAction(self.create_dist_csv_act)
         self.distance_headers = ['Time', 'Distance']
 
+        # 0 is exact, otherwise the number of random pairs sampled per frame
+        self.sample_box = QSpinBox()
+        self.sample_box.setRange(0, 10000000)
+        self.sample_box.setSingleStep(1000)
+        self.sample_box.setSpecialValueText('Exact')
+        self.sample_box.setPrefix('Sampled pairs: ')
+        self.sample_box.editingFinished.connect(self.prepare_table)
+        self.tool_bar.addWidget(self.sample_box)
+
         self.prepare_table()
 
     def prepare_table(self):
-        ied = self.channel.get_time_point_mean_and_stdev()
-        packets = list(ied.values())
+        n_pairs = self.sample_box.value()
+        if n_pairs:
+            stats = self.channel.get_time_point_sampled_stats(n_pairs)
+            self.ied_headers = ['Time', 'Mean', 'Standard Deviation', 'Mean CI Low', 'Mean CI High',
+                                'Stdev CI Low', 'Stdev CI High', 'Sampled']
+            columns = [stats['time'], stats['mean'], stats['stdev'], stats['mean_low'], stats['mean_high'],
+                       stats['stdev_low'], stats['stdev_high'], stats['sampled']]
+        else:
+            stats = self.channel.get_time_point_distance_stats()
+            self.ied_headers = ['Time', 'Mean', 'Standard Deviation', 'Min', 'Max', 'Count']
+            columns = [stats['time'], stats['mean'], stats['stdev'], stats['min'], stats['max'], stats['count']]
         #
-        self.table_widget.setColumnCount(3)
+        self.table_widget.setColumnCount(len(self.ied_headers))
         self.table_widget.setHorizontalHeaderLabels(self.ied_headers)
-        for row, packet in enumerate(packets):
-            self.table_widget.setRowCount(row+1)
+        self.table_widget.setRowCount(len(stats['time']))
+        for row, packet in enumerate(zip(*columns)):
             for col, val in enumerate(packet):
                 table_item = QTableWidgetItem(str(val))
                 self.table_widget.setItem(row, col, table_item)
@@ -62,20 +82,12 @@ class IEDWidget(QMainWindow):
             fd.close()
 
     def export_dist_csv(self):
-        # pass
         file, _ = QFileDialog.getSaveFileName(self, "Select file name IED .csv files",
                                               QtCore.QDir.homePath(), "CSV (*.csv)")
-        _csv = ""
-        _csv += ','.join(self.distance_headers) + '\n'
         if file:
-            distance_dict = self.channel.get_distance_between_pos_by_time()
-            for time, pos in distance_dict.items():
-                for d in pos:
-                    row = list()
-                    row.append(str(time))
-                    row.append(str(d))
-                    _csv += ','.join(row) + '\n'
-
-            fd = open(file, 'w')
-            fd.write(_csv)
-            fd.close()
+            # written frame by frame, one block of distances at a time
+            with open(file, 'w') as fd:
+                fd.write(','.join(self.distance_headers) + '\n')
+                for time, positions in self.channel.frame_index().items():
+                    for chunk in pdist_chunks(positions):
+                        np.savetxt(fd, chunk, fmt=f'{time},%s')
@@ -10,7 +10,7 @@ class JumpChartWidget(QChartView):
     def __init__(self, track, parent=None):
         QChartView.__init__(self, parent)
         self.track = track
-        self.points = jump_analysis(list(track.time_position_map.values()))
+        self.points = jump_analysis(track.positions)
         self.bar_set = QBarSet("Time Points")
         for p in self.points:
             self.bar_set.append(p)
@@ -38,5 +38,5 @@ class JumpChartWidget(QChartView):
         self.setRenderHint(QtGui.QPainter.Antialiasing)
 
     def __bar_clicked(self, index):
-        time_points = list(self.track.time_position_map.keys())[index:index+2]
+        time_points = self.track.time[index:index+2].tolist()
         self.bar_clicked.emit(time_points, self.track.track_id, str(self.bar_set.at(index)))
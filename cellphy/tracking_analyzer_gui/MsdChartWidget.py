@@ -7,6 +7,8 @@ from PyQt5.QtCore import QSize
 from PyQt5.QtChart import QChart, QChartView, QSplineSeries, QValueAxis, QScatterSeries
 import numpy as np
 from cellphy.Analysis import Track, Channel
+from cellphy.Analysis.Track import batch_fit
+from cellphy.Analysis.fitting import lag_times, power_law
 from .VTKWidget import VTKWidget
 
 
@@ -123,8 +125,11 @@ class MSDWidget(QMainWindow):
         self.central_widget = QSplitter(self)
         self.setCentralWidget(self.central_widget)
 
-        if type(source_list) is not list:
+        if isinstance(source_list, (Channel, Track)):
             source_list = [source_list]
+        else:
+            # channel.tracks is a view, not a list
+            source_list = list(source_list)
 
         assert type(source_list[0]) in [Channel, Track]
 
@@ -141,7 +146,7 @@ class MSDWidget(QMainWindow):
     def init_tracks(self, source_list):
         tracks = []
         for track in source_list:
-            if len(track.time_position_map) > 3:
+            if len(track) > 3:
                 tracks.append(track)
 
         msd_widget, msd_widget_velocity, alfa_all, alfa_lt_0_4, alfa_bt_0_4_1_2, \
@@ -189,16 +194,18 @@ class MSDWidget(QMainWindow):
         alfa_gt_1_2_v = []
         alfa_gt_1_2_n = []
 
-        for track in tracks:
-            y = np.array(list(track.msd(limit=26)))
+        # one msd and one fit per track, later basic_fit calls are cache hits
+        tracks_d, tracks_alfa = batch_fit(tracks, limit=26)
+        for track, d, alfa in zip(tracks, tracks_d, tracks_alfa):
+            y = track.msd(limit=26)
             max_y.append(y.max())
-            x = np.array(list(range(1, len(y) + 1))) * 3.8
+            x = lag_times(len(y))
             scattered_line = ScatterSeries(x, y, track, self.base_channel_color if self.change_color else track.color, track.name)
             scattered_line.selected.connect(self.msd_line_clicked)
 
             chart.addSeries(scattered_line)
 
-            alfa, __y = track.basic_fit()
+            __y = power_law(x, d, alfa)
             alfa_all.append(alfa)
             line_series = LineSeries(x, __y, track, self.get_alfa_color(alfa) if self.change_color else track.color, track.name)
             line_series.selected.connect(self.msd_line_clicked)
@@ -0,0 +1,86 @@
+from PyQt5.QtWidgets import QMainWindow, QAction, QFileDialog, QSplitter, QTableWidget, QTableWidgetItem
+from PyQt5.QtChart import QChart, QChartView, QLineSeries, QValueAxis
+from PyQt5.QtGui import QPainter
+import PyQt5.QtCore as QtCore
+import os
+
+
+class SweepWidget(QMainWindow):
+    """
+    Pairs against radius for every channel combination of a radius sweep,
+    as a chart and a table, with the per radius pair spots exportable as csv.
+    """
+
+    def __init__(self, sweeps, radii, title='Radius sweep', parent=None):
+        QMainWindow.__init__(self, parent)
+        # sweeps: list of (channel_a, channel_b, RadiusSweep)
+        self.sweeps = sweeps
+        self.radii = radii
+        self.title = title
+        self.setWindowTitle(title)
+
+        self.tool_bar = self.addToolBar('Sweep ToolBar')
+        export_act = QAction('Export CSV', self)
+        export_act.triggered.connect(self.export_csv)
+        self.tool_bar.addAction(export_act)
+
+        self.central_widget = QSplitter(QtCore.Qt.Vertical, self)
+        self.setCentralWidget(self.central_widget)
+        self.prepare_chart()
+        self.prepare_table()
+
+    def prepare_chart(self):
+        chart = QChart()
+        chart.setTitle('Pairs vs radius')
+        axis_x = QValueAxis()
+        axis_x.setTitleText('Radius')
+        axis_y = QValueAxis()
+        axis_y.setTitleText('Pairs')
+        chart.addAxis(axis_x, QtCore.Qt.AlignBottom)
+        chart.addAxis(axis_y, QtCore.Qt.AlignLeft)
+
+        max_pairs = 1
+        for channel_a, channel_b, sweep in self.sweeps:
+            counts = sweep.counts(self.radii)
+            series = QLineSeries()
+            series.setName(f'{channel_a.suffix} & {channel_b.suffix}')
+            for radius, pairs in zip(counts['radius'], counts['pairs']):
+                series.append(float(radius), float(pairs))
+            max_pairs = max(max_pairs, int(counts['pairs'].max()) if len(counts) else 0)
+            chart.addSeries(series)
+            series.attachAxis(axis_x)
+            series.attachAxis(axis_y)
+        axis_x.setRange(float(min(self.radii)), float(max(self.radii)))
+        axis_y.setRange(0, max_pairs)
+
+        chart_view = QChartView(chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+        self.central_widget.addWidget(chart_view)
+
+    def prepare_table(self):
+        headers = ['Channels', 'Radius', 'Pairs', 'Spots']
+        table_widget = QTableWidget()
+        table_widget.setColumnCount(len(headers))
+        table_widget.setHorizontalHeaderLabels(headers)
+        row = 0
+        for channel_a, channel_b, sweep in self.sweeps:
+            counts = sweep.counts(self.radii)
+            for radius, pairs, spots in zip(counts['radius'], counts['pairs'], counts['spots']):
+                table_widget.setRowCount(row + 1)
+                for col, val in enumerate([f'{channel_a.suffix} & {channel_b.suffix}', f'{radius:g}', pairs, spots]):
+                    table_widget.setItem(row, col, QTableWidgetItem(str(val)))
+                row += 1
+        self.central_widget.addWidget(table_widget)
+
+    def export_csv(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select folder for the sweep .csv files",
+                                                     QtCore.QDir.homePath())
+        if not directory:
+            return
+
+        for channel_a, channel_b, sweep in self.sweeps:
+            name = f'{channel_a.suffix}{channel_b.suffix}'
+            sweep.counts(self.radii).to_csv(os.path.join(directory, f'radius_counts{name}.csv'), index=False)
+            for radius in self.radii:
+                sweep.spots(radius, channel_a.suffix, channel_b.suffix).to_csv(
+                    os.path.join(directory, f'pairs_r{radius:g}{name}.csv'), index=False)
@@ -60,7 +60,7 @@ class VTKWidget(QVTKRenderWindowInteractor):
     def add_track(self, track, updated_color = []):
         color = updated_color if len(updated_color)> 1 else track.color
         # color[-1] = 255
-        self.create_line(list(track.time_position_map.values()), color)
+        self.create_line(track.positions.tolist(), color)
         self.tracks.append(track)
 
     def create_line(self, pos, color):
@@ -94,7 +94,7 @@ class VTKWidget(QVTKRenderWindowInteractor):
                 return
 
         for t_point in time_points:
-            point = track.time_position_map.get(t_point, None)
+            point = track.get_position_by_time_point(t_point)
             if point is None:
                 continue
             point_source = vtk.vtkSphereSource()
@@ -118,11 +118,11 @@ class VTKWidget(QVTKRenderWindowInteractor):
             if _track.track_id == track.track_id:
                 color = _track.color
                 color[-1] = 255
-                self.create_line(list(_track.time_position_map.values()), color)
+                self.create_line(_track.positions.tolist(), color)
             else:
                 color = _track.color
                 color[-1] = 20
-                self.create_line(list(_track.time_position_map.values()), color)
+                self.create_line(_track.positions.tolist(), color)
 
         self.render_lines()
 
@@ -1,7 +1,9 @@
 import argparse
+import multiprocessing
 import os
 import sys
-from cellphy.Analysis.Tools import calculate_msd, calculate_msb_by_bin, track_analyze, analyze_mean_stddev
+from cellphy.Analysis.Tools import calculate_msd, calculate_msb_by_bin, track_analyze, analyze_mean_stddev, \
+    calculate_ensemble_msd
 from cellphy.tracking_analyzer_gui import start_ui
 
 is_linux = False
@@ -24,17 +26,28 @@ def process_args():
 
     m_arguments = commands.add_parser('msd')
     bm_arguments = commands.add_parser('binmsd')
+    em_arguments = commands.add_parser('ensemblemsd')
     t_arguments = commands.add_parser('track')
     ui_arguments = commands.add_parser('gui')
 
     # Analysis
     a_arguments.add_argument('path', default='.')
+    a_arguments.add_argument('--bin-width', type=float, default=None)
+    a_arguments.add_argument('--bins', type=int, default=50)
+    a_arguments.add_argument('--nn', type=int, default=0)
+    a_arguments.add_argument('--sample', type=int, default=0)
+    a_arguments.add_argument('--seed', type=int, default=0)
     a_arguments.set_defaults(func=analyze_mean_stddev)
 
     # msd
     m_arguments.add_argument('path', default='.')
     m_arguments.set_defaults(func=calculate_msd)
 
+    # ensemble msd
+    em_arguments.add_argument('path', nargs='+')
+    em_arguments.add_argument('--max-lag', type=int, default=25)
+    em_arguments.set_defaults(func=calculate_ensemble_msd)
+
     # msd_bin
     bm_arguments.add_argument('path', default='.')
     bm_arguments.add_argument('--fit', action='store_true')
@@ -43,6 +56,8 @@ def process_args():
     # track
     t_arguments.add_argument('path', nargs='+')
     t_arguments.add_argument('--radius', type=float, default=1)
+    t_arguments.add_argument('--sweep', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'), default=None)
+    t_arguments.add_argument('--processes', type=int, default=1)
     t_arguments.set_defaults(func=track_analyze)
 
     # start gui
@@ -97,4 +112,6 @@ def install(args):
 
 
 if __name__ == '__main__':
+    # channel loading uses worker processes, needed for frozen windows builds
+    multiprocessing.freeze_support()
     process_args()